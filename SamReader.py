@@ -11,10 +11,25 @@ Usage:
 """
 
 import os
+import stat
+import time
+import json
+import math
+import pickle
+import hashlib
 import re
 import sys
-import csv
-import numpy as np
+import shutil
+import itertools
+import functools
+import bisect
+import mmap
+import gzip
+import zlib
+import binascii
+import struct
+import importlib
+from collections import defaultdict, deque
 
 __authors__ = ("Alizée ARNOUX")
 __contact__ = ("alizee.arnoux@etu.umontpellier.fr")
@@ -32,51 +47,80 @@ __licence__ = ("This program is free software: you can redistribute it and/or"
                " Public License along with this program. If not, see"
                " <https://www.gnu.org/licenses/>.")
 
+
+
+class LazyModule:
+    """Imports a module the first time one of its attributes is used."""
+
+    __slots__ = ('name', 'alias')
+
+    def __init__(self, name, alias):
+        self.name = name
+        self.alias = alias
+
+    def __getattr__(self, attribute):
+        module = importlib.import_module(self.name)
+        # The module replaces this object for the next uses.
+        globals()[self.alias] = module
+
+        return getattr(module, attribute)
+
+
+class SamReaderError(Exception):
+    """Error in an input file, printed by main before exiting."""
+
+
+# NumPy and the process pools are only imported when a file is analyzed,
+# not for the help.
+np = LazyModule('numpy', 'np')
+futures = LazyModule('concurrent.futures', 'futures')
+multiprocessing = LazyModule('multiprocessing', 'multiprocessing')
+
 # Matrix
-HEADER_LINE = np.array([['VN', 'SO', 'GO', 'SS'],
-                        ['Format version', 'Sorting order of alignments',
-                         'Grouping of alignments',
-                         'Sub-sorting order of alignments']])
-REF_SEQ_DICTIONARY = np.array([['SN', 'LN', 'AH', 'AN', 'AS', 'DS', 'M5',
-                                'SP', 'TP', 'UR'],
-                               ['Reference sequence name',
-                                'Reference sequence length',
-                                'Alternate locus',
-                                'Alternative reference sequence names',
-                                'Genome assembly identifier', 'Description',
-                                'MD5 checksum of the sequence', 'Species',
-                                'Molecule topology',
-                                'URI of the sequence']])
-READ_GROUP = np.array([['ID', 'BC', 'CN', 'DS', 'DT', 'FO', 'KS', 'LB',
-                        'PG', 'PI', 'PL', 'PM', 'PU', 'SM'],
-                       ['Read group identifier', 'Barcode sequence',
-                        'Name of sequencing center', 'Description',
-                        'Date the run was produced', 'Flow order',
-                        'Array of nucleotide bases', 'Library',
-                        'Processing programs', 'Predicted median insert size',
-                        'Platform/technology', 'Platform model',
-                        'Platform unit', 'Sample']])
-PROGRAM = np.array([['ID', 'PN', 'CL', 'PP', 'DS', 'VN'],
-                    ['Program record identifier', 'Program name',
-                     'Command line', 'Previous @PG-ID', 'Description',
-                     'program version']])
-COMMENTS = np.array([['CO'], ['Commentaire(s)']])
-CIGAR_MATRIX = np.array([['M', 'I', 'D', 'N', 'S', 'H', 'P', '=', 'X'],
-                         ['Alignement Match', 'Insertion', 'Deletion',
-                          'Skipped region', 'Soft Clipping', 'Hard Clipping',
-                          'Padding', 'Sequence Match', 'Sequence Mismatch']])
-QUAL_INTERPRET = np.array([['!', '"', '#', '$', '%', '&', '\'', '(', ')',
-                            '*', '+', ', ', '-', '.', '/', '0', '1', '2', '3',
-                            '4', '5', '6', '7', '8', '9', ':', ';', '<', '=',
-                            '>', '?', '@', 'A', 'B', 'C', 'D', 'E', 'F', 'G',
-                            'H', 'I'],
-                           ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9',
-                            '10', '11', '12', '13', '14', '15', '16', '17',
-                            '18', '19', '20', '21', '22', '23', '24', '25',
-                            '26', '27', '28', '29', '30', '31', '32', '33',
-                            '34', '35', '36', '37', '38', '39', '40']])
+HEADER_LINE = (('VN', 'SO', 'GO', 'SS'),
+               ('Format version', 'Sorting order of alignments',
+                'Grouping of alignments', 'Sub-sorting order of alignments'))
+REF_SEQ_DICTIONARY = (('SN', 'LN', 'AH', 'AN', 'AS', 'DS', 'M5', 'SP', 'TP',
+                       'UR'),
+                      ('Reference sequence name',
+                       'Reference sequence length',
+                       'Alternate locus',
+                       'Alternative reference sequence names',
+                       'Genome assembly identifier', 'Description',
+                       'MD5 checksum of the sequence', 'Species',
+                       'Molecule topology',
+                       'URI of the sequence'))
+READ_GROUP = (('ID', 'BC', 'CN', 'DS', 'DT', 'FO', 'KS', 'LB', 'PG', 'PI',
+               'PL', 'PM', 'PU', 'SM'),
+              ('Read group identifier', 'Barcode sequence',
+               'Name of sequencing center', 'Description',
+               'Date the run was produced', 'Flow order',
+               'Array of nucleotide bases', 'Library',
+               'Processing programs', 'Predicted median insert size',
+               'Platform/technology', 'Platform model',
+               'Platform unit', 'Sample'))
+PROGRAM = (('ID', 'PN', 'CL', 'PP', 'DS', 'VN'),
+           ('Program record identifier', 'Program name', 'Command line',
+            'Previous @PG-ID', 'Description', 'program version'))
+COMMENTS = (('CO',), ('Commentaire(s)',))
+CIGAR_MATRIX = (('M', 'I', 'D', 'N', 'S', 'H', 'P', '=', 'X'),
+                ('Alignement Match', 'Insertion', 'Deletion',
+                 'Skipped region', 'Soft Clipping', 'Hard Clipping',
+                 'Padding', 'Sequence Match', 'Sequence Mismatch'))
+QUAL_INTERPRET = (('!', '"', '#', '$', '%', '&', '\'', '(', ')', '*', '+',
+                   ', ', '-', '.', '/', '0', '1', '2', '3', '4', '5', '6',
+                   '7', '8', '9', ':', ';', '<', '=', '>', '?', '@', 'A', 'B',
+                   'C', 'D', 'E', 'F', 'G', 'H', 'I'),
+                  ('0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '10',
+                   '11', '12', '13', '14', '15', '16', '17', '18', '19',
+                   '20', '21', '22', '23', '24', '25', '26', '27', '28',
+                   '29', '30', '31', '32', '33', '34', '35', '36', '37',
+                   '38', '39', '40'))
 
 # Dictionary
+QUAL_ACCURACY = {str(call): round((1 - (10 ** (-int(quality) / 10))) * 100, 2)
+                 for call, quality in zip(QUAL_INTERPRET[0],
+                                          QUAL_INTERPRET[1])}
 HEADER_FIELD = {0: HEADER_LINE, 1: REF_SEQ_DICTIONARY,
                 2: READ_GROUP, 3: PROGRAM, 4: COMMENTS}
 HEADER_TITLE = {0: 'Header line', 1: 'Reference sequence dictionary',
@@ -99,14 +143,137 @@ CODONS = {'TTT': 'Phe', 'TTC': 'Phe', 'TTA': 'Leu', 'TTG': 'Leu', 'CTT': 'Leu',
           'CGC': 'Arg', 'CGA': 'Arg', 'CGG': 'Arg', 'AGT': 'Ser', 'AGC': 'Ser',
           'AGA': 'Arg', 'AGG': 'Arg', 'GGT': 'Gly', 'GGC': 'Gly', 'GGA': 'Gly',
           'GGG': 'Gly', 'TAA': 'STOP', 'TAG': 'STOP', 'TGA': 'STOP'}
+BASE_CODE = {'A': 0, 'C': 1, 'G': 2, 'T': 3, 'N': 4}
+# Translates the ASCII bytes of a sequence in base codes.
+BASE_TRANSLATION = bytes(BASE_CODE.get(chr(i), 4) for i in range(256))
+# Reference sequences may be soft-masked in lower case.
+REFERENCE_TRANSLATION = bytes(BASE_CODE.get(chr(i).upper(), 4)
+                              for i in range(256))
 
 # Tuple
+BASES = ('A', 'C', 'G', 'T', 'N')
+COMPLEMENT_CODE = (3, 2, 1, 0, 4)
 HEADERS = ('@HD', '@SQ', '@RG', '@PG', '@CO')
-OPTIONS = ('-o', '--check')
+SAM_EXTENSIONS = ('.sam', '.sam.gz', '.sam.bgz')
+INDEX_EXTENSION = '.sri'
+BAM_EXTENSION = '.bam'
+BAM_CIGAR_OPS = 'MIDNSHP=X'
+# Integer types of the BAM optional fields, as struct formats.
+BAM_TAG_TYPES = {'c': 'b', 'C': 'B', 's': 'h', 'S': 'H', 'i': 'i', 'I': 'I',
+                 'f': 'f'}
+BAM_TAG_STRUCTS = {value_type: struct.Struct(f'<{code}')
+                   for value_type, code in BAM_TAG_TYPES.items()}
+# Base of each 4-bit code of SEQ, written as a hexadecimal digit.
+BAM_BASE_TRANSLATION = bytes.maketrans(b'0123456789abcdef',
+                                       b'=ACMGRSVTWYHKDBN')
+BAM_QUAL_TRANSLATION = bytes(min(i + 33, 126) for i in range(256))
+OPTIONS = ('-o', '--check', '--workers', '--batch', '--sub-slices',
+           '--reference', '--cds', '--index', '--region', '--no-progress',
+           '--progress-log', '--profile', '--profile-out', '--jobs',
+           '--checkpoint', '--resume', '--cache', '--cache-size',
+           '--clear-cache', '--insert-bin', '--coverage', '--low-depth',
+           '--depth-track', '--variants', '--variant-qual', '--variant-freq',
+           '--variant-depth')
+MAP_STATUS = ('unmapped', 'badly mapped', 'totally mapped', 'NULL', 'PENDING')
 
 # Constant
-ARGUMENTS_LIST = sys.argv[1:]
+# Arguments of the command line, set by main.
+ARGUMENTS_LIST = []
 MIN_LINE_LENGHT = 11
+MUTATION_BUFFER = 10000
+# Number of BGZF blocks decompressed ahead by each thread.
+BGZF_AHEAD = 4
+BAM_READ_SIZE = 65536
+N_CODE = 4
+# Phred scores from '!' (0) to '~' (93).
+QUAL_LEVELS = 94
+UNSET_LENGTH = -1
+# Number of CIGAR strings kept decoded, and the operations counted in the
+# read sequence and on the reference.
+CIGAR_CACHE = 4096
+CIGAR_QUERY_OPS = 'MIS=X'
+CIGAR_SPAN_OPS = 'MDN=X'
+# Width of the gap and overlap bins of the read pairs.
+INSERT_BIN = 10
+# Size of the TLEN histogram of a reference when created, doubled when a
+# longer TLEN is found up to TLEN_LIMIT. Longer TLEN are counted apart.
+TLEN_BINS = 1024
+TLEN_LIMIT = 65536
+TLEN_PERCENTILES = (5, 25, 75, 95)
+# Reads not counted in the coverage depth: unmapped, secondary, QC fail and
+# duplicate, as in samtools depth.
+COVERAGE_SKIP = 0x704
+# Depths of the breadth of coverage, and the default one under which a
+# base is in a low coverage interval.
+COVERAGE_BREADTH = (1, 5, 10, 20, 30)
+LOW_DEPTH = 10
+# Number of reads buffered before being added to the depth, and size of
+# the depth and allele counts of a reference of unknown length when
+# created.
+COVERAGE_BUFFER = 65536
+COVERAGE_BINS = 1024
+# Base call quality under which a base is not counted in the allele
+# counts, and the frequency and depth of a candidate variant (--variants).
+VARIANT_QUAL = 0
+VARIANT_FREQUENCY = 0.2
+VARIANT_DEPTH = 10
+# Number of aligned segments of reads buffered before being counted.
+ALLELE_BUFFER = 4096
+
+SAMPLE_HASH = 2654435761
+# The clock is read every PROGRESS_RECORDS records, the progression is
+# shown at most every PROGRESS_INTERVAL seconds.
+PROGRESS_RECORDS = 4096
+PROGRESS_INTERVAL = 0.5
+# With --profile, the per-record stages are timed once every
+# PROFILE_SAMPLE calls.
+PROFILE_SAMPLE = 16
+# Number of bytes at the start of the file and before the offset of a
+# checkpoint checked on resume.
+CHECKPOINT_BYTES = 65536
+# Number of positions per bin of the sidecar index.
+INDEX_BIN = 16384
+# Maximal size of the result cache in bytes, and the blocks of each input
+# file read for its fingerprint.
+CACHE_SIZE = 1024 * 10**6
+FINGERPRINT_BLOCKS = 16
+FINGERPRINT_BYTES = 65536
+# Options which do not change the results, and whether they take a value.
+CACHE_NEUTRAL = {'--workers': True, '--batch': True, '--jobs': True,
+                 '--no-progress': False, '--progress-log': True,
+                 '--profile': False, '--profile-out': True,
+                 '--checkpoint': True, '--resume': False, '--cache': True,
+                 '--cache-size': True, '--clear-cache': False}
+
+# Mandatory fields: name, regular expression, minimal and maximal value.
+SAM_FIELDS = (('QNAME', '[!-?A-~]{1,254}', None, None),
+              ('FLAG', '[0-9]+', 0, (2 ** 16) - 1),
+              ('RNAME', r'\*|[0-9A-Za-z!#$%&+./: ;?@^_|~-]'
+                        '[0-9A-Za-z!#$%&*+./: ;=?@^_|~-]*', None, None),
+              ('POS', '[0-9]+', 0, (2 ** 31) - 1),
+              ('MAPQ', '[0-9]+', 0, (2 ** 8) - 1),
+              ('CIGAR', r'\*|([0-9]+[MIDNSHPX=])+', None, None),
+              ('RNEXT', r'\*|=|[0-9A-Za-z!#$%&+./: ;?@^_|~-]'
+                        '[0-9A-Za-z!#$%&*+./: ;=?@^_|~-]*', None, None),
+              ('PNEXT', '[0-9]+', 0, (2 ** 31) - 1),
+              ('TLEN', '-?[0-9]+', (-2 ** 31) + 1, (2 ** 31) - 1),
+              ('SEQ', r'\*|[A-Za-z=.]+', None, None),
+              ('QUAL', '[!-~]+', None, None))
+FIELD_RANGES = tuple((i, len(str(maximum)), minimum, maximum)
+                     for i, (name, pattern, minimum, maximum)
+                     in enumerate(SAM_FIELDS) if maximum is not None)
+
+# Fixed-size fields of a BAM record: refID, pos, l_read_name, mapq, bin,
+# n_cigar_op, flag, l_seq, next_refID, next_pos, tlen.
+BAM_CORE = struct.Struct('<iiBBHHHiiii')
+
+# Regular expression
+TOTAL_MATCH = re.compile('[0-9]+M')
+CIGAR_MATCH = re.compile(r'[0-9]+\D')
+MD_TOKEN = re.compile(r'([0-9]+)(\^[A-Za-z]*|[^0-9^]?)')
+FIELD_MATCH = tuple(re.compile(field[1]) for field in SAM_FIELDS)
+RECORD_MATCH = re.compile('\t'.join(f'(?:{field[1]})'
+                                     for field in SAM_FIELDS))
 
 
 def help_flag():
@@ -234,13 +401,18 @@ def help():
 
 def input_error_check(argument):
     """Verifies that the inputs are non-empty SAM files."""
+    # The format of a stream is found from its first bytes.
+    if is_stream(argument):
+        return
     if os.path.isfile(argument) is False:
         print(f"PATH ERROR for '{argument}': "
               "the input is not a file")
         exit()
-    elif argument.endswith('.sam') is False:
+    elif argument.endswith(SAM_EXTENSIONS + (BAM_EXTENSION,)) is False:
         print(f"FORMAT ERROR for '{argument}': "
-              "only the SAM file format is accepted as input")
+              "only the SAM file format (.sam, or compressed .sam.gz or"
+              " .sam.bgz) and the BAM file format (.bam) are accepted as"
+              " input")
         exit()
     elif os.path.getsize(argument) == 0:
         print(f"FILE ERROR for '{argument}': "
@@ -248,6 +420,16 @@ def input_error_check(argument):
         exit()
 
 
+def is_stream(argument):
+    """Returns True for the standard input ('-') and named pipes."""
+    if argument == '-':
+        return True
+    try:
+        return stat.S_ISFIFO(os.stat(argument).st_mode)
+    except OSError:
+        return False
+
+
 def input_file_number():
     """Return the number of files given as input."""
     fileNumber = 0
@@ -268,124 +450,876 @@ def integrity_line_number():
         # Finds the instruction given in parameters.
         if ARGUMENTS_LIST[i+1] == 'all':
             to_check = 'ALL'
+        # Checks a random fraction of the lines, e.g. sample:0.01.
+        elif ARGUMENTS_LIST[i+1].startswith('sample:'):
+            to_check = ('sample', float(ARGUMENTS_LIST[i+1][7:]))
+            if not 0 < to_check[1] <= 1:
+                print("INPUT ERROR: the sampling rate must be in ]0, 1]")
+                exit()
+        # Checks one line every K lines, e.g. stride:100.
+        elif ARGUMENTS_LIST[i+1].startswith('stride:'):
+            to_check = ('stride', int(ARGUMENTS_LIST[i+1][7:]))
+            if to_check[1] < 1:
+                print("INPUT ERROR: the stride must be at least 1")
+                exit()
         else:
             to_check = int(ARGUMENTS_LIST[i+1])
 
     return to_check
 
 
-def analysis_progress(line, file_size, octet_analyzed):
-    """Shows the progression of file analysis."""
-    for field in line:
-        # 1 character = 1 octet, + 1 octet for the tabulation.
-        octet_analyzed += len(field) + 1
-    analysis_progression = round(octet_analyzed * 100 / file_size)
-    print(f"progression of file analysis: {analysis_progression}%", end='\r')
+def worker_number():
+    """Returns the number of processes to analyze each file with."""
+    workers = 1
+    if '--workers' in ARGUMENTS_LIST:
+        i = ARGUMENTS_LIST.index('--workers')
+        workers = int(ARGUMENTS_LIST[i+1])
+        if workers < 1:
+            print("INPUT ERROR: --workers must be at least 1")
+            exit()
 
-    return octet_analyzed
+    return workers
 
 
-def file_handler(input_file):
-    """Reads SAM file as csv file delimited by tabulations."""
-    fi = open(ARGUMENTS_LIST[input_file])
-    file = csv.reader(fi, delimiter='\t', quoting=csv.QUOTE_NONE)
-    fi.close
+def job_number():
+    """Returns the number of files to analyze at once, 'all' for all cores."""
+    jobs = 1
+    if '--jobs' in ARGUMENTS_LIST:
+        i = ARGUMENTS_LIST.index('--jobs')
+        if ARGUMENTS_LIST[i+1] == 'all':
+            jobs = os.cpu_count()
+        else:
+            jobs = int(ARGUMENTS_LIST[i+1])
+        if jobs < 1:
+            print("INPUT ERROR: --jobs must be at least 1")
+            exit()
 
-    return file
+    return jobs
 
 
-def integrity_check(line, re, line_number, to_check):
-    """Verifies the integrity of each field for a given number of lines."""
-    if type(to_check) == str or line_number <= to_check:
-        # There are 11 mandatory fields.
-        ERROR_COUNT = 11
-        # Verifying regular expression matching to official documentation.
-        if re.fullmatch('[!-?A-~]{1,254}', line[0]):
-            ERROR_COUNT -= 1
-        # if the field is incorrect,  an error message is displayed
-        else:
-            print("QNAME ERROR: "
-                  "an unauthorized regular expression was found.\n"
-                  f"QNAME: {line[0]}\nLine: {line}\n")
+def insert_bin_width():
+    """Returns the width of the gap and overlap bins of the read pairs."""
+    width = INSERT_BIN
+    if '--insert-bin' in ARGUMENTS_LIST:
+        i = ARGUMENTS_LIST.index('--insert-bin')
+        width = int(ARGUMENTS_LIST[i+1])
+        if width < 1:
+            print("INPUT ERROR: --insert-bin must be at least 1")
+            exit()
 
-        if re.fullmatch('[0-9]*', line[1]) and int(line[1]) <= ((2 ** 16) - 1):
-            ERROR_COUNT -= 1
-        else:
-            print("FLAG ERROR: "
-                  "an unauthorized regular expression was found.\n"
-                  f"FLAG: {line[1]}\nLine: {line}\n")
+    return width
 
-        if re.fullmatch(r'\*|[0-9A-Za-z!#$%&+./: ;?@^_|~-]'
-                        '[0-9A-Za-z!#$%&*+./: ;=?@^_|~-]*', line[2]):
-            ERROR_COUNT -= 1
-        else:
-            print("RNAME ERROR: "
-                  "an unauthorized regular expression was found.\n"
-                  f"RNAME: {line[2]}\nLine: {line}\n")
 
-        if re.fullmatch('[0-9]*', line[3]) and int(line[3]) <= ((2 ** 31) - 1):
-            ERROR_COUNT -= 1
-        else:
-            print("POS ERROR: "
-                  "an unauthorized regular expression was found.\n"
-                  f"POS: {line[3]}\nLine: {line}\n")
+def coverage_options():
+    """Returns whether the depth is counted, its low threshold and track."""
+    track = '--depth-track' in ARGUMENTS_LIST
+    coverage = track or '--coverage' in ARGUMENTS_LIST
+    low = LOW_DEPTH
+    if '--low-depth' in ARGUMENTS_LIST:
+        i = ARGUMENTS_LIST.index('--low-depth')
+        low = int(ARGUMENTS_LIST[i+1])
+        if low < 1:
+            print("INPUT ERROR: --low-depth must be at least 1")
+            exit()
 
-        if re.fullmatch('[0-9]*', line[4]) \
-        and int(line[4]) >= 0 and int(line[4]) <= ((2**8)-1):
-            ERROR_COUNT -= 1
-        else:
-            print("MAPQ ERROR: "
-                  "an unauthorized regular expression was found.\n"
-                  f"MAPQ: {line[4]}\nLine: {line}\n")
+    return coverage, low, track
+
+
+def variant_options():
+    """Returns whether the alleles are counted, the minimal QUAL of the
+    bases counted, and the minimal frequency and depth of the variants.
+    """
+    variants = '--variants' in ARGUMENTS_LIST
+    quality = VARIANT_QUAL
+    frequency = VARIANT_FREQUENCY
+    depth = VARIANT_DEPTH
+    if '--variant-qual' in ARGUMENTS_LIST:
+        i = ARGUMENTS_LIST.index('--variant-qual')
+        quality = int(ARGUMENTS_LIST[i+1])
+        if not 0 <= quality < QUAL_LEVELS:
+            print(f"INPUT ERROR: --variant-qual must be from 0 to"
+                  f" {QUAL_LEVELS - 1}")
+            exit()
+    if '--variant-freq' in ARGUMENTS_LIST:
+        i = ARGUMENTS_LIST.index('--variant-freq')
+        frequency = float(ARGUMENTS_LIST[i+1])
+        if not 0 < frequency <= 1:
+            print("INPUT ERROR: --variant-freq must be above 0 and at most"
+                  " 1")
+            exit()
+    if '--variant-depth' in ARGUMENTS_LIST:
+        i = ARGUMENTS_LIST.index('--variant-depth')
+        depth = int(ARGUMENTS_LIST[i+1])
+        if depth < 1:
+            print("INPUT ERROR: --variant-depth must be at least 1")
+            exit()
 
-        if re.fullmatch(r'\*|([0-9]+[MIDNSHPX=])+', line[5]):
-            ERROR_COUNT -= 1
-        else:
-            print("CIGAR ERROR: "
-                  "an unauthorized regular expression was found.\n"
-                  f"CIGAR: {line[5]}\nLine: {line}\n")
+    return variants, quality, frequency, depth
 
-        if re.fullmatch(r'\*|=|[0-9A-Za-z!#$%&+./: ;?@^_|~-]'
-                        '[0-9A-Za-z!#$%&*+./: ;=?@^_|~-]*', line[6]):
-            ERROR_COUNT -= 1
-        else:
-            print("RNEXT ERROR: "
-                  "an unauthorized regular expression was found.\n"
-                  f"RNEXT: {line[6]}\nLine: {line}\n")
 
-        if (re.fullmatch('[0-9]*', line[7])
-         and int(line[7]) <= ((2 ** 31) - 1)):
-            ERROR_COUNT -= 1
-        else:
-            print("PNEXT ERROR: "
-                  "an unauthorized regular expression was found.\n"
-                  f"PNEXT: {line[7]}\nLine: {line}\n")
+def batch_size():
+    """Returns the number of records to analyze per block, 0 if per line."""
+    size = 0
+    if '--batch' in ARGUMENTS_LIST:
+        i = ARGUMENTS_LIST.index('--batch')
+        size = int(ARGUMENTS_LIST[i+1])
+        if size < 1:
+            print("INPUT ERROR: --batch must be at least 1")
+            exit()
 
-        if (re.fullmatch('-[0-9]*|[0-9]*', line[8]) and
-        int(line[8]) >= ((-2 ** 31) + 1) and int(line[8]) <= ((2 ** 31) - 1)):
-            ERROR_COUNT -= 1
-        else:
-            print("TLEN ERROR: "
-                  "an unauthorized regular expression was found.\n"
-                  f"TLEN: {line[8]}\nLine: {line}\n")
+    return size
+
+
+def reference_files():
+    """Returns the FASTA file of the references and BED file of the CDS."""
+    fasta = None
+    bed = None
+    if '--reference' in ARGUMENTS_LIST:
+        fasta = ARGUMENTS_LIST[ARGUMENTS_LIST.index('--reference') + 1]
+        if '--cds' in ARGUMENTS_LIST:
+            bed = ARGUMENTS_LIST[ARGUMENTS_LIST.index('--cds') + 1]
+
+    return fasta, bed
+
+
+def analysis_region():
+    """Returns the reference, start and end of --region ref:start-end."""
+    region = None
+    if '--region' in ARGUMENTS_LIST:
+        argument = ARGUMENTS_LIST[ARGUMENTS_LIST.index('--region') + 1]
+        ref, separator, interval = argument.rpartition(':')
+        # A reference name alone selects the whole reference, an interval
+        # starts with a digit.
+        if not separator or not interval[:1].isdigit():
+            return (argument, 1, float('inf'))
+        start = end = 0
+        if re.fullmatch('[0-9]+-[0-9]+', interval):
+            start, end = (int(position) for position in interval.split('-'))
+        if not 1 <= start <= end:
+            print("INPUT ERROR: --region must be given as ref:start-end,"
+                  " with 1 <= start <= end")
+            exit()
+        region = (ref, start, end)
+
+    return region
+
+
+def profile_options():
+    """Returns if the stages are profiled, and the file to write it in."""
+    profile = '--profile' in ARGUMENTS_LIST
+    path = None
+    if '--profile-out' in ARGUMENTS_LIST:
+        profile = True
+        path = ARGUMENTS_LIST[ARGUMENTS_LIST.index('--profile-out') + 1]
+
+    return profile, path
+
+
+def progress_options():
+    """Returns if the progression is shown, and the file to log it in."""
+    display = '--no-progress' not in ARGUMENTS_LIST
+    log = None
+    if '--progress-log' in ARGUMENTS_LIST:
+        log = ARGUMENTS_LIST[ARGUMENTS_LIST.index('--progress-log') + 1]
+
+    return display, log
+
+
+class Progress:
+    """Shows the progression of file analysis.
+
+    The position in the file is only read every PROGRESS_RECORDS records,
+    and reported at most every PROGRESS_INTERVAL seconds, in the terminal
+    and as JSON lines in the --progress-log file.
+    """
+
+    __slots__ = ('current_file', 'position', 'file_size', 'display', 'log',
+                 'start', 'last', 'ref_lengths')
+
+    def __init__(self, current_file, position, display, log):
+        """Starts the clock, position is None if it can not be read."""
+        self.current_file = current_file
+        self.position = position
+        self.file_size = None
+        if position is not None:
+            self.file_size = os.path.getsize(current_file)
+        self.display = display
+        self.log = log
+        self.start = time.monotonic()
+        self.last = self.start
+        self.ref_lengths = {}
+
+    def first_check(self):
+        """Returns the record at which to sample first, -1 if disabled."""
+        if not self.display and self.log is None:
+            return -1
+        return PROGRESS_RECORDS
+
+    def reference_length(self, line):
+        """Keeps the length of the references given in the @SQ lines."""
+        sq_length(line, self.ref_lengths)
+
+    def sample(self, records, line):
+        """Reports if enough time passed, returns the next record to sample."""
+        now = time.monotonic()
+        if now - self.last >= PROGRESS_INTERVAL:
+            self.last = now
+            self.report(records, line, now)
+
+        return records + PROGRESS_RECORDS
+
+    def report(self, records, line, now, done=False):
+        """Shows and logs the throughput and progression of the analysis."""
+        elapsed = max(now - self.start, 1e-9)
+        status = {'file': self.current_file, 'records': records,
+                  'reads_per_s': round(records / elapsed),
+                  'elapsed_s': round(elapsed, 3), 'done': done}
+        text = [f"{records} reads", f"{status['reads_per_s']} reads/s"]
+        if self.position is not None:
+            octet_analyzed = self.position()
+            status['bytes'] = octet_analyzed
+            status['size'] = self.file_size
+            status['mb_per_s'] = round(octet_analyzed / elapsed / 1e6, 2)
+            status['progress'] = round(octet_analyzed / self.file_size, 4)
+            status['eta_s'] = None
+            if octet_analyzed:
+                status['eta_s'] = round((self.file_size - octet_analyzed)
+                                        * elapsed / octet_analyzed, 1)
+            text = ([f"{round(status['progress'] * 100)}%"] + text
+                    + [f"{status['mb_per_s']} MB/s",
+                       f"ETA {status['eta_s']} s"])
+        # The reference and position of the current read, if it has any.
+        if len(line) > 3 and line[2] in self.ref_lengths:
+            status['reference'] = line[2]
+            status['reference_progress'] = round(
+                int(line[3]) / self.ref_lengths[line[2]], 4)
+            text.append(f"{line[2]} "
+                        f"{round(status['reference_progress'] * 100)}%")
+        if done:
+            status['cigar_cache'] = cigar_cache_statistics()
+        if self.display and not done:
+            print("progression of file analysis: " + " | ".join(text),
+                  end='\r')
+        if self.log is not None:
+            with open(self.log, 'a') as log:
+                log.write(json.dumps(status) + '\n')
+
+
+class Profiler:
+    """Counts the calls, records and time of the stages of the analysis.
+
+    The stages are replaced in the module by wrappers, so nothing is added
+    to the analysis when --profile is not given. The per-record stages
+    are only timed once every PROFILE_SAMPLE calls, their time and
+    records are extrapolated to all the calls.
+    """
+
+    __slots__ = ('stats', 'active', 'start')
+
+    def __init__(self):
+        """Starts the clock of the whole run."""
+        # Calls, then records, number and time of the timed calls, and
+        # whether the stage was called from another stage, e.g. by
+        # batch_analysis.
+        self.stats = {}
+        self.active = [0]
+        self.start = time.perf_counter()
+
+    def wrap(self, name, function, sample, block):
+        """Returns the function counting and timing the calls of a stage."""
+        stats = self.stats[name] = [0, 0, 0, 0.0, False]
+        active = self.active
+        clock = time.perf_counter
+
+        @functools.wraps(function)
+        def profiled(*args):
+            stats[0] += 1
+            if stats[0] % sample:
+                return function(*args)
+            # The first argument of a block stage is the block of records.
+            stats[1] += len(args[0]) if block else 1
+            if active[0]:
+                stats[4] = True
+            active[0] += 1
+            start = clock()
+            result = function(*args)
+            stats[3] += clock() - start
+            active[0] -= 1
+            stats[2] += 1
+            return result
+
+        return profiled
+
+    def install(self):
+        """Replaces the stages of the analysis by their profiled version."""
+        module = globals()
+        for name, sample, block in PROFILED_STAGES:
+            module[name] = self.wrap(name, module[name], sample, block)
+
+    def stage_times(self):
+        """Returns the time estimated for each stage called at least once."""
+        return {name: stats[3] * stats[0] / stats[2]
+                for name, stats in self.stats.items() if stats[2]}
+
+    def report(self, path=None):
+        """Prints the time of each stage, and writes them to a JSON file."""
+        total = time.perf_counter() - self.start
+        stage_times = self.stage_times()
+        # The time not spent in a stage is mostly reading the file.
+        other = max(total - sum(seconds for name, seconds
+                                in stage_times.items()
+                                if not self.stats[name][4]), 0)
+        rows = []
+        for name, seconds in stage_times.items():
+            calls, records, timed, timed_seconds, nested = self.stats[name]
+            records = round(records * calls / timed)
+            rows.append({'stage': name, 'nested': nested, 'calls': calls,
+                         'records': records, 'timed_calls': timed,
+                         'seconds': round(seconds, 4),
+                         'percent': round(seconds * 100 / total, 2),
+                         'us_per_record': round(seconds * 1e6 / records, 3)})
+        rows.sort(key=lambda row: row['seconds'], reverse=True)
+        rows.append({'stage': 'other (reading, splitting)', 'nested': False,
+                     'calls': None,
+                     'records': None, 'timed_calls': None,
+                     'seconds': round(other, 4),
+                     'percent': round(other * 100 / total, 2),
+                     'us_per_record': None})
+
+        print(f"\nProfile ({round(total, 3)} s):\n"
+              f"{'Stage':<28}{'calls':>10}{'records':>10}{'time (s)':>10}"
+              f"{'%':>8}{'us/record':>11}")
+        for row in rows:
+            stage = row['stage'] + ('*' if row['nested'] else '')
+            print(f"{stage:<28}{row['calls'] or '':>10}"
+                  f"{row['records'] or '':>10}{row['seconds']:>10}"
+                  f"{row['percent']:>8}{row['us_per_record'] or '':>11}")
+        if any(row['nested'] for row in rows):
+            print("* also counted in the time of the stage calling it")
+        if path is not None:
+            with open(path, 'w') as profile:
+                json.dump({'total_seconds': round(total, 4),
+                           'sample': PROFILE_SAMPLE, 'stages': rows,
+                           'cigar_cache': cigar_cache_statistics()},
+                          profile, indent=2)
+
+
+def is_bgzf(path):
+    """Returns True if the file is compressed in BGZF blocks."""
+    with open(path, 'rb') as fi:
+        header = fi.read(16)
+    # gzip magic number, FEXTRA flag and 'BC' extra subfield.
+    return (len(header) == 16 and header[:4] == b'\x1f\x8b\x08\x04'
+            and header[12:14] == b'BC')
+
+
+def bgzf_blocks(fi):
+    """Yields the compressed data of each BGZF block of a file."""
+    while True:
+        header = fi.read(12)
+        if len(header) < 12:
+            return
+        extra_length = int.from_bytes(header[10:12], 'little')
+        extra = fi.read(extra_length)
+        block_size = None
+        i = 0
+        # Finds the total block size in the 'BC' extra subfield.
+        while i + 4 <= extra_length:
+            subfield_length = int.from_bytes(extra[i + 2:i + 4], 'little')
+            if extra[i:i + 2] == b'BC':
+                block_size = int.from_bytes(extra[i + 4:i + 6], 'little') + 1
+            i += 4 + subfield_length
+        if header[:2] != b'\x1f\x8b' or block_size is None:
+            raise SamReaderError("FORMAT ERROR: the file is not a valid BGZF"
+                                 " file")
+        block = fi.read(block_size - 12 - extra_length)
+        # The block ends with the CRC32 and the uncompressed size.
+        yield block[:-8]
+
+
+def inflate_block(data):
+    """Decompresses the raw deflate data of a BGZF block."""
+    return zlib.decompress(data, -15)
+
+
+def bgzf_chunks(path, threads):
+    """Yields the decompressed BGZF blocks of a file, in order.
+
+    Blocks are inflated by a pool of threads (zlib releases the GIL),
+    with a bounded number of blocks decompressed ahead.
+    """
+    with open(path, 'rb') as fi:
+        with futures.ThreadPoolExecutor(max_workers=threads) as pool:
+            inflating = deque()
+            for data in bgzf_blocks(fi):
+                inflating.append(pool.submit(inflate_block, data))
+                if len(inflating) >= threads * BGZF_AHEAD:
+                    yield inflating.popleft().result()
+            while inflating:
+                yield inflating.popleft().result()
+
+
+def bgzf_lines(path, threads):
+    """Yields the lines of a BGZF file, decompressed by threads."""
+    rest = b''
+    for chunk in bgzf_chunks(path, threads):
+        chunk = rest + chunk
+        # Lines may be split between two blocks.
+        cut = chunk.rfind(b'\n') + 1
+        rest = chunk[cut:]
+        yield from chunk[:cut].decode().splitlines(True)
+    if rest:
+        yield rest.decode()
+
+
+def split_fields(line):
+    """Splits a line of a SAM file in its tabulated fields."""
+    fields = line.split('\t')
+    # Only the last field is copied to remove the end of line.
+    fields[-1] = fields[-1].rstrip('\r\n')
+
+    return fields
+
+
+class BgzfStream:
+    """Reads the decompressed bytes of a BGZF file as a stream."""
+
+    __slots__ = ('chunks', 'buffer', 'offset')
+
+    def __init__(self, path, threads):
+        """Starts the decompression of the BGZF blocks."""
+        self.chunks = bgzf_chunks(path, threads)
+        self.buffer = b''
+        self.offset = 0
+
+    def read(self, size):
+        """Returns the next bytes, fewer at the end of the file."""
+        while len(self.buffer) - self.offset < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer = self.buffer[self.offset:] + chunk
+            self.offset = 0
+        data = self.buffer[self.offset:self.offset + size]
+        self.offset += len(data)
+
+        return data
+
+
+class BamRecord:
+    """Alignment record of a BAM file, seen as the fields of a SAM line.
+
+    FLAG, POS, MAPQ, TLEN and CIGAR are decoded as integers when the
+    record is read. The text of a field is only built the first time it
+    is accessed, so QNAME, SEQ, QUAL and the optional fields are only
+    decoded for the reads that use them.
+    """
+
+    __slots__ = ('data', 'ref_names', 'ref_id', 'pos', 'mapq', 'flag',
+                 'next_ref_id', 'next_pos', 'tlen', 'cigar', 'seq_length',
+                 'seq_start', 'tags_start', 'fields', 'optional')
+
+    def __init__(self, data, ref_names):
+        """Decodes the fixed-size fields and the CIGAR of the record."""
+        (self.ref_id, self.pos, name_length, self.mapq, bin_mq_nl,
+         cigar_length, self.flag, self.seq_length, self.next_ref_id,
+         self.next_pos, self.tlen) = BAM_CORE.unpack_from(data)
+        self.data = data
+        self.ref_names = ref_names
+        cigar_start = BAM_CORE.size + name_length
+        # Each operation is coded as length << 4 | operation.
+        self.cigar = struct.unpack_from(f'<{cigar_length}I', data,
+                                        cigar_start)
+        self.seq_start = cigar_start + 4 * cigar_length
+        self.tags_start = (self.seq_start + (self.seq_length + 1) // 2
+                           + self.seq_length)
+        self.fields = [None] * MIN_LINE_LENGHT
+        self.optional = None
+
+    def text_field(self, i):
+        """Returns a mandatory field of the record as SAM text."""
+        if i == 0:
+            return self.data[BAM_CORE.size:
+                             BAM_CORE.size + self.data[8] - 1].decode()
+        if i == 1:
+            return str(self.flag)
+        if i == 2:
+            return '*' if self.ref_id < 0 else self.ref_names[self.ref_id]
+        if i == 3:
+            return str(self.pos + 1)
+        if i == 4:
+            return str(self.mapq)
+        if i == 5:
+            return bam_cigar(self.cigar)
+        if i == 6:
+            if self.next_ref_id < 0:
+                return '*'
+            if self.next_ref_id == self.ref_id:
+                return '='
+            return self.ref_names[self.next_ref_id]
+        if i == 7:
+            return str(self.next_pos + 1)
+        if i == 8:
+            return str(self.tlen)
+        if i == 9:
+            return self.sequence()
+
+        return self.quality()
+
+    def sequence(self):
+        """Decodes SEQ, stored as 4-bit base codes."""
+        if self.seq_length == 0:
+            return '*'
+        packed = self.data[self.seq_start:self.seq_start +
+                           (self.seq_length + 1) // 2]
+
+        return binascii.hexlify(packed).translate(
+            BAM_BASE_TRANSLATION).decode()[:self.seq_length]
+
+    def quality(self):
+        """Decodes QUAL, stored as Phred scores."""
+        start = self.seq_start + (self.seq_length + 1) // 2
+        if self.seq_length == 0 or self.data[start] == 255:
+            return '*'
+
+        return self.data[start:start + self.seq_length].translate(
+            BAM_QUAL_TRANSLATION).decode()
+
+    def tags(self):
+        """Decodes the optional fields as 'TAG:TYPE:VALUE' texts."""
+        data = self.data
+        tags = []
+        i = self.tags_start
+        while i < len(data):
+            tag = data[i:i + 2].decode()
+            value_type = chr(data[i + 2])
+            i += 3
+            if value_type == 'A':
+                tags.append(f'{tag}:A:{chr(data[i])}')
+                i += 1
+            elif value_type in 'ZH':
+                end = data.index(0, i)
+                tags.append(f'{tag}:{value_type}:{data[i:end].decode()}')
+                i = end + 1
+            elif value_type == 'B':
+                subtype = chr(data[i])
+                count = int.from_bytes(data[i + 1:i + 5], 'little')
+                values = struct.unpack_from(
+                    f'<{count}{BAM_TAG_TYPES[subtype]}', data, i + 5)
+                i += 5 + count * BAM_TAG_STRUCTS[subtype].size
+                tags.append(f'{tag}:B:{subtype}'
+                            + ''.join(f',{value}' for value in values))
+            else:
+                value_struct = BAM_TAG_STRUCTS[value_type]
+                (value,) = value_struct.unpack_from(data, i)
+                i += value_struct.size
+                if value_type == 'f':
+                    tags.append(f'{tag}:f:{value:g}')
+                else:
+                    tags.append(f'{tag}:i:{value}')
+
+        return tags
+
+    def optional_fields(self):
+        """Returns the optional fields, decoded once."""
+        if self.optional is None:
+            self.optional = self.tags()
+
+        return self.optional
+
+    def all_fields(self):
+        """Returns the mandatory then the optional fields as SAM text."""
+        return ([self[i] for i in range(MIN_LINE_LENGHT)]
+                + self.optional_fields())
+
+    def __len__(self):
+        return MIN_LINE_LENGHT + len(self.optional_fields())
+
+    def __getitem__(self, i):
+        if type(i) == slice:
+            # The optional fields alone (e.g. for SamTags) do not need the
+            # text of the mandatory fields.
+            if (i.start == MIN_LINE_LENGHT and i.stop is None
+                    and i.step is None):
+                return self.optional_fields()
+            return self.all_fields()[i]
+        if i < 0 or i >= MIN_LINE_LENGHT:
+            return self.all_fields()[i]
+        field = self.fields[i]
+        if field is None:
+            field = self.fields[i] = self.text_field(i)
+
+        return field
+
+
+@functools.lru_cache(maxsize=CIGAR_CACHE)
+def bam_cigar(cigar):
+    """Returns the CIGAR string of BAM operations, kept for the next reads."""
+    if not cigar:
+        return '*'
+
+    return ''.join(f'{op >> 4}{BAM_CIGAR_OPS[op & 15]}' for op in cigar)
+
+
+def bam_lines(path, threads):
+    """Yields the header lines then the records of a BAM file."""
+    return bam_records(BgzfStream(path, threads), path)
+
+
+def bam_records(stream, path):
+    """Yields the header lines then the records of a decompressed BAM."""
+    if stream.read(4) != b'BAM\x01':
+        raise SamReaderError(f"FORMAT ERROR for '{path}': the file is not a"
+                             " BAM file")
+    text_length = int.from_bytes(stream.read(4), 'little')
+    for row in stream.read(text_length).decode().split('\n'):
+        if row.strip('\x00'):
+            yield row.split('\t')
+    ref_names = []
+    for i in range(int.from_bytes(stream.read(4), 'little')):
+        name_length = int.from_bytes(stream.read(4), 'little')
+        ref_names.append(stream.read(name_length)[:-1].decode())
+        stream.read(4)
+    # The records are cut from reads of BAM_READ_SIZE bytes, each one
+    # after its block_size.
+    buffer = b''
+    while True:
+        chunk = stream.read(BAM_READ_SIZE)
+        if not chunk:
+            if buffer:
+                raise SamReaderError(f"FORMAT ERROR for '{path}': the last"
+                                     " record is truncated")
+            return
+        buffer += chunk
+        offset = 0
+        while len(buffer) - offset >= 4:
+            end = offset + 4 + int.from_bytes(buffer[offset:offset + 4],
+                                              'little')
+            if end > len(buffer):
+                break
+            yield BamRecord(buffer[offset + 4:end], ref_names)
+            offset = end
+        buffer = buffer[offset:]
+
+
+def index_path(current_file):
+    """Returns the path of the sidecar index of a SAM file."""
+    return current_file + INDEX_EXTENSION
+
+
+def reference_span(cigar):
+    """Returns the number of reference bases covered by a CIGAR string."""
+    return decode_cigar(cigar).reference_span
+
+
+def build_index(input_file):
+    """Writes the offsets of each reference and coordinate bin of a file.
+
+    For each bin of INDEX_BIN positions, the index keeps the offset of the
+    first line whose alignment overlaps the bin, so a region can be read
+    by seeking to the bin of its start.
+    """
+    current_file = ARGUMENTS_LIST[input_file]
+    if (not current_file.endswith(SAM_EXTENSIONS[0])
+            or is_stream(current_file)):
+        print(f"INDEX ERROR for '{current_file}': only uncompressed SAM "
+              "files on disk can be indexed")
+        exit()
+    bins = {}
+    ends = {}
+    ref = None
+    last_pos = 0
+    offset = 0
+    with open(current_file, 'rb') as fi:
+        for raw in fi:
+            start = offset
+            offset += len(raw)
+            if raw.startswith(b'@'):
+                continue
+            line = split_line(raw)
+            if line[2] != ref:
+                if line[2] in bins:
+                    print(f"INDEX ERROR for '{current_file}': the file is "
+                          "not sorted by coordinate")
+                    exit()
+                ref = line[2]
+                last_pos = 0
+                bins[ref] = []
+            pos = int(line[3])
+            if pos < last_pos:
+                print(f"INDEX ERROR for '{current_file}': the file is not "
+                      "sorted by coordinate")
+                exit()
+            last_pos = pos
+            ends[ref] = offset
+            if pos == 0:
+                continue
+            last = (pos + max(reference_span(line[5]), 1) - 2) // INDEX_BIN
+            offsets = bins[ref]
+            # Lines are sorted, the first line found for a bin is kept.
+            while len(offsets) <= last:
+                offsets.append(start)
+
+    with open(index_path(current_file), 'w') as index:
+        file_stat = os.stat(current_file)
+        index.write(f"#SamReader\t{file_stat.st_size}"
+                    f"\t{file_stat.st_mtime_ns}"
+                    f"\t{INDEX_BIN}\n")
+        for ref, offsets in bins.items():
+            index.write(f"{ref}\t{ends[ref]}\t"
+                        f"{','.join(str(start) for start in offsets)}\n")
+    print(f"INDEX FILE: {index_path(current_file)} created.")
+
+
+def read_index(current_file):
+    """Returns the end offset and bin offsets of each reference."""
+    if not os.path.isfile(index_path(current_file)):
+        print(f"INDEX ERROR for '{current_file}': no index found, create "
+              "it with --index")
+        exit()
+    index = {}
+    with open(index_path(current_file)) as fi:
+        title = fi.readline().rstrip('\n').split('\t')
+        file_stat = os.stat(current_file)
+        if (title[1:3] != [str(file_stat.st_size),
+                           str(file_stat.st_mtime_ns)]
+                or int(title[3]) != INDEX_BIN):
+            print(f"INDEX ERROR for '{current_file}': the index is out of "
+                  "date, create it again with --index")
+            exit()
+        for row in fi:
+            ref, end, offsets = row.rstrip('\n').split('\t')
+            index[ref] = (int(end), [int(start)
+                                     for start in offsets.split(',') if start])
+
+    return index
+
+
+def region_lines(current_file, region):
+    """Yields the header lines then the alignments overlapping a region."""
+    ref, region_start, region_end = region
+    with open(current_file, 'rb') as fi:
+        for raw in fi:
+            if not raw.startswith(b'@'):
+                break
+            yield split_line(raw)
+        index = read_index(current_file)
+        if ref not in index:
+            return
+        end, offsets = index[ref]
+        first_bin = (region_start - 1) // INDEX_BIN
+        if first_bin >= len(offsets):
+            return
+        fi.seek(offsets[first_bin])
+        offset = offsets[first_bin]
+        while offset < end:
+            raw = fi.readline()
+            offset += len(raw)
+            line = split_line(raw)
+            pos = int(line[3])
+            if pos > region_end:
+                return
+            if pos + max(reference_span(line[5]), 1) > region_start:
+                yield line
+
+
+def file_handler(input_file, region=None, start=0):
+    """Reads SAM file as lines of fields delimited by tabulations.
+
+    Also returns a function giving the position reached in the file on
+    disk, or None if it is not known. Uncompressed files can be read from
+    the start offset of a line.
+    """
+    return open_lines(ARGUMENTS_LIST[input_file], region, start)
+
+
+def open_lines(current_file, region=None, start=0):
+    """Reads the SAM or BAM file of a path, as file_handler."""
+    if region is not None:
+        return region_lines(current_file, region), None
+    if is_stream(current_file):
+        return stream_lines(current_file), None
+    # BAM records are already split in fields.
+    if current_file.endswith(BAM_EXTENSION):
+        return bam_lines(current_file, os.cpu_count()), None
+    # The position of a binary file is the end of the last line read.
+    if current_file.endswith(SAM_EXTENSIONS[0]):
+        fi = open(current_file, 'rb')
+        fi.seek(start)
+        return map(split_line, fi), fi.tell
+    elif is_bgzf(current_file):
+        fi = bgzf_lines(current_file, os.cpu_count())
+        position = None
+    else:
+        fi = gzip.open(current_file, 'rt')
+        # Position in the compressed file.
+        position = fi.buffer.fileobj.tell
+    file = map(split_fields, fi)
 
-        if re.fullmatch(r'\*|[A-Za-z=.]+', line[9]):
-            ERROR_COUNT -= 1
-        else:
-            print("SEQ ERROR: "
-                  "an unauthorized regular expression was found.\n"
-                  f"SEQ: {line[9]}\nLine: {line}\n")
+    return file, position
 
-        if re.fullmatch('[!-~]+', line[10]):
-            ERROR_COUNT -= 1
-        else:
-            print("QUAL ERROR: "
-                  "an unauthorized regular expression was found.\n"
-                  f"QUAL: {line[10]}\nLine: {line}\n")
 
-        return ERROR_COUNT
+def stream_lines(current_file):
+    """Reads the standard input or a named pipe in a single pass.
 
+    The format is found from the first bytes: SAM or BAM compressed with
+    gzip or BGZF, or uncompressed SAM.
+    """
+    if current_file == '-':
+        fi = sys.stdin.buffer
+    else:
+        fi = open(current_file, 'rb')
+    if fi.peek(2)[:2] == b'\x1f\x8b':
+        # BGZF blocks are read as the members of a gzip file.
+        fi = gzip.GzipFile(fileobj=fi)
+        if fi.peek(4)[:4] == b'BAM\x01':
+            return bam_records(fi, current_file)
+
+    return map(split_line, fi)
+
+
+def line_to_check(line_number, to_check):
+    """Returns True if the line is part of the lines to check."""
+    if type(to_check) == str:
+        return True
+    if type(to_check) == tuple:
+        if to_check[0] == 'stride':
+            return line_number % to_check[1] == 0
+        # Multiplicative hashing spreads the sampled lines over the file.
+        return (line_number * SAMPLE_HASH) % 2 ** 32 < to_check[1] * 2 ** 32
+
+    return line_number <= to_check
+
+
+def integrity_check(line, re, line_number, to_check):
+    """Verifies the integrity of each field for a given number of lines."""
+    if not line_to_check(line_number, to_check):
+        return 0
+    if len(line) < MIN_LINE_LENGHT:
+        print("LINE ERROR: "
+              f"{MIN_LINE_LENGHT - len(line)} mandatory field(s) missing.\n"
+              f"Line: {line}\n")
+        return MIN_LINE_LENGHT - len(line)
+    # Most lines are valid: a single regular expression checks the record.
+    if RECORD_MATCH.fullmatch('\t'.join(line[:MIN_LINE_LENGHT])):
+        for i, width, minimum, maximum in FIELD_RANGES:
+            # Numbers shorter than the maximum value are within the range.
+            if (len(line[i]) >= width and
+                    not minimum <= int(line[i]) <= maximum):
+                break
+        else:
+            return 0
+
+    # Finds and displays each incorrect field.
     ERROR_COUNT = 0
+    for i, (name, pattern, minimum, maximum) in enumerate(SAM_FIELDS):
+        if (FIELD_MATCH[i].fullmatch(line[i]) is None or
+                (maximum is not None and
+                 not minimum <= int(line[i]) <= maximum)):
+            ERROR_COUNT += 1
+            print(f"{name} ERROR: "
+                  "an unauthorized regular expression was found.\n"
+                  f"{name}: {line[i]}\nLine: {line}\n")
 
     return ERROR_COUNT
 
@@ -409,21 +1343,33 @@ def binary_flag(flag):
 def header_analysis(header_count, line, output_head_list):
     """Analyzes the header section."""
     head = 'no'
-    if line[0] in HEADERS:
+    # The records of a BAM file follow its header lines.
+    if type(line) != BamRecord and line[0] in HEADERS:
         head = 'yes'
         header_count += 1
         i = HEADERS.index(line[0])
         # Writes the header section title (abbreviated and full).
         output_head_list.append(f"{HEADERS[i]} - {HEADER_TITLE[i]}")
+        abbreviations, titles = HEADER_FIELD[i]
         for subfield in line[1:]:
-            # Searches the matrix for the abbreviated subfield title.
-            [n, m] = np.where(HEADER_FIELD[i] == subfield[:2])
+            # Searches the matrix for the abbreviated subfield title, an
+            # unknown one is written as [].
+            title = [titles[m] for m, abbreviation in enumerate(abbreviations)
+                     if abbreviation == subfield[:2]]
             # Writes the corresponding full title and file description.
-            output_head_list.append(f"{HEADER_FIELD[i][n + 1, m]}: "
-                                    f"{subfield[3:]}")
+            output_head_list.append(f"{title}: {subfield[3:]}")
     return head, header_count, output_head_list
 
 
+def sq_length(line, ref_lengths):
+    """Adds the length of the reference of a @SQ line to ref_lengths."""
+    fields = dict(field.split(':', 1) for field in line[1:] if ':' in field)
+    if 'SN' in fields and fields.get('LN', '').isdigit():
+        ref_lengths[fields['SN']] = int(fields['LN'])
+
+    return ref_lengths
+
+
 def output_header_info(outputFile, output_head_list):
     """Writes header informations."""
     for i in range(len(output_head_list)):
@@ -432,7 +1378,7 @@ def output_header_info(outputFile, output_head_list):
             outputFile.write("\n")
 
 
-def paired_reads(flag, unmap_count, badmap_count, totalmap_count, line,
+def paired_reads(flag, unmap_count, badmap_count, totalmap_count, cigar,
                  dico_pair, not_paired_count, map_status_first,
                  map_status_sec, read_length):
     """Returns True if the read is mapped and stores the mapping status."""
@@ -449,7 +1395,7 @@ def paired_reads(flag, unmap_count, badmap_count, totalmap_count, line,
         mapped = False
     # For the not unmapped reads, counts the totally and badly mapped.
     if mapped is True:
-        if re.match('(?![0-9]+M$)', line[5]):
+        if not cigar.totally_mapped:
             badmap_count += 1
             if int(flag[-7]) == 1:
                 map_status_first = "badly mapped"
@@ -458,18 +1404,15 @@ def paired_reads(flag, unmap_count, badmap_count, totalmap_count, line,
         else:
             totally_mapped = True
             totalmap_count += 1
-            read_length = line[5][:3]
+            # The CIGAR of a totally mapped read is its length then 'M'.
+            read_length = str(cigar.query_length)
             if int(flag[-7]) == 1:
                 map_status_first = "totally mapped"
             else:
                 map_status_sec = "totally mapped"
     # If the read is the second in the pair, increments the corresponding dict.
     if int(flag[-8]) == 1:
-        if (f'{map_status_sec} + {map_status_first}') in dico_pair.keys():
-            dico_pair[f'{map_status_sec} + {map_status_first}'] += 1
-        # As the dict.keys are predefined, reverse order of reads if not found.
-        else:
-            dico_pair[f'{map_status_first} + {map_status_sec}'] += 1
+        pair_count(dico_pair, map_status_first, map_status_sec)
     # If the read is neither the first nor second, then it is not paired.
     if int(flag[-7]) != 1 and int(flag[-8]) != 1:
         not_paired_count += 1
@@ -479,269 +1422,1240 @@ def paired_reads(flag, unmap_count, badmap_count, totalmap_count, line,
             totally_mapped)
 
 
-def dico_init():
-    """Creates dictionaries / lists for the current reference."""
-    dico_pair = {"unmapped + unmapped": 0,
-                  "unmapped + totally mapped": 0, "unmapped + badly mapped": 0,
-                  "badly mapped + totally mapped": 0,
-                  "badly mapped + badly mapped": 0,
-                  "totally mapped + totally mapped": 0}
-    dico_cigar = {}
-    dico_align = {-1: 0, 0: 0, 1: 0}
-
-    substitutions_list = []
-    dico_substitutions = {}
-    call_quality_list = []
-    mut_position_list = []
-    qname_list = []
-    aa_orf1_list = []
-    aa_orf2_list = []
-    aa_orf3_list = []
-
-    return (dico_pair, dico_cigar, dico_align, substitutions_list,
-            dico_substitutions, call_quality_list, mut_position_list,
-            qname_list, aa_orf1_list, aa_orf2_list, aa_orf3_list)
-
-
-def fetch_dico(ref):
-    """Returns dictionaries for the reference, if already initiated."""
-    dico_pair = globals()[f'dico_pair_{ref}']
-    dico_cigar = globals()[f'dico_cigar_{ref}']
-    dico_align = globals()[f'dico_align_{ref}']
-    substitutions_list = globals()[f'sub_list_{ref}']
-    dico_substitutions = globals()[f'dico_sub_{ref}']
-    call_quality_list = globals()[f'dico_qual_{ref}']
-    mut_position_list = globals()[f'dico_pos_{ref}']
-    qname_list = globals()[f'dico_qname_{ref}']
-    aa_orf1_list = globals()[f'dico_orf1_{ref}']
-    aa_orf2_list = globals()[f'dico_orf2_{ref}']
-    aa_orf3_list = globals()[f'dico_orf3_{ref}']
-
-    return (dico_align, dico_cigar, dico_pair, substitutions_list,
-           dico_substitutions, call_quality_list, mut_position_list,
-            qname_list, aa_orf1_list, aa_orf2_list, aa_orf3_list)
-
-
-def cigar_analysis(line, dico_cigar):
-    """Stores cigar info in a dictionary."""
-    info_cigar = re.findall(r'[0-9]+\D', line[5])
-    for info in info_cigar:
-        if info[-1] in dico_cigar.keys():
-            dico_cigar[info[-1]] += int(info[:-1])
+def pair_count(dico_pair, map_status_first, map_status_sec, count=1):
+    """Increments the pair category of both reads mapping status.
+
+    A pair whose mate was not read (status 'NULL', e.g. before the start
+    of --region) is not counted.
+    """
+    if 'NULL' in (map_status_first, map_status_sec):
+        return dico_pair
+    if (f'{map_status_sec} + {map_status_first}') in dico_pair.keys():
+        dico_pair[f'{map_status_sec} + {map_status_first}'] += count
+    # As the dict.keys are predefined, reverse order of reads if not found.
+    else:
+        dico_pair[f'{map_status_first} + {map_status_sec}'] += count
+
+    return dico_pair
+
+
+class ReferenceData:
+    """Counters of the reads aligned on a reference.
+
+    Mutation records are buffered and appended to the CSV file of the
+    reference, only the substitution counts are kept in memory. These are
+    counted in a matrix indexed by the read base then the reference base
+    given by MD (A, C, G, T, N), as the substitutions are written
+    'read -> reference', optionally sliced by base call quality and by
+    strand.
+
+    With coverage, the reads add 1 at their first base and -1 after their
+    last one in a difference array, the depth is its cumulative sum. It
+    has one integer per base of the reference (ref_length, from the @SQ
+    line), or grows with the reads when the length is not known.
+
+    With alleles, the bases of the reads (of QUAL at least allele_quality)
+    aligned on each position of the reference are counted in a matrix of
+    one row per position and one column per base (A, C, G, T, N). The base
+    of the reference at each position is the one most often given by the
+    reads with MD: the read base where it matches, the MD base where it
+    does not. These are counted in reference_counts, as the alleles.
+    """
+
+    __slots__ = ('dico_pair', 'dico_cigar', 'dico_align', 'insert_bin',
+                 'tlen_counts', 'tlen_long', 'substitution_matrix',
+                 'quality_matrix', 'strand_matrix', 'records', 'csv_name',
+                 'csv_title', 'csv_written', 'genome', 'cds', 'ref_length',
+                 'coverage', 'coverage_starts', 'coverage_ends',
+                 'coverage_end', 'coverage_summed', 'allele_counts',
+                 'reference_counts', 'allele_quality', 'allele_segments',
+                 'reference_mismatches', 'allele_end')
+
+    def __init__(self, csv_name, csv_title='', slices=False,
+                 insert_bin=INSERT_BIN, ref_length=None, coverage=False,
+                 alleles=False, allele_quality=VARIANT_QUAL):
+        """Creates dictionaries / lists for the reference."""
+        self.dico_pair = {"unmapped + unmapped": 0,
+                          "unmapped + totally mapped": 0,
+                          "unmapped + badly mapped": 0,
+                          "badly mapped + totally mapped": 0,
+                          "badly mapped + badly mapped": 0,
+                          "totally mapped + totally mapped": 0}
+        self.dico_cigar = {}
+        self.dico_align = {-1: 0, 0: 0, 1: 0}
+        self.insert_bin = insert_bin
+        # Number of pairs of each TLEN, the TLEN over TLEN_LIMIT in a dict.
+        self.tlen_counts = np.zeros(TLEN_BINS, dtype=np.int64)
+        self.tlen_long = {}
+        self.substitution_matrix = np.zeros((len(BASES), len(BASES)),
+                                            dtype=np.int64)
+        self.quality_matrix = None
+        self.strand_matrix = None
+        if slices:
+            self.quality_matrix = np.zeros((QUAL_LEVELS, len(BASES),
+                                            len(BASES)), dtype=np.int64)
+            self.strand_matrix = np.zeros((2, len(BASES), len(BASES)),
+                                          dtype=np.int64)
+
+        self.records = []
+        self.csv_name = csv_name
+        self.csv_title = csv_title
+        self.csv_written = False
+
+        # Indexed FASTA file and CDS of the reference, if given.
+        self.genome = None
+        self.cds = None
+
+        self.ref_length = ref_length
+        self.coverage = None
+        if coverage:
+            self.coverage = np.zeros((ref_length or COVERAGE_BINS) + 1,
+                                     dtype=np.int32)
+        self.coverage_starts = []
+        self.coverage_ends = []
+        # End of the last covered base, and whether coverage is the depth.
+        self.coverage_end = 0
+        self.coverage_summed = False
+
+        self.allele_counts = None
+        self.reference_counts = None
+        if alleles:
+            rows = ref_length or COVERAGE_BINS
+            self.allele_counts = np.zeros((rows, len(BASES)), dtype=np.int32)
+            self.reference_counts = np.zeros((rows, len(BASES)),
+                                             dtype=np.int32)
+        self.allele_quality = allele_quality
+        # Aligned segments of the reads (reference start, bases, QUAL and
+        # whether the read has MD), and the mismatches given by MD
+        # (position, reference base and read base, -1 if not found).
+        self.allele_segments = []
+        self.reference_mismatches = []
+        self.allele_end = 0
+
+    def add_mutation(self, qname, position, read_base, md_base, quality,
+                     strand, aa_orf1, aa_orf2, aa_orf3, aa_cds=None):
+        """Counts a substitution and buffers its mutation record.
+
+        read_base is the base of the read, md_base the reference base
+        given by MD at the same position.
+        """
+        # Bases other than A, C, G and T are counted as N.
+        read_code = BASE_CODE.get(read_base, N_CODE)
+        md_code = BASE_CODE.get(md_base, N_CODE)
+        self.substitution_matrix[read_code, md_code] += 1
+        if self.quality_matrix is not None:
+            self.quality_matrix[ord(quality) - 33, read_code, md_code] += 1
+            self.strand_matrix[strand, read_code, md_code] += 1
+        self.records.append((qname, position, read_base, md_base, quality,
+                             aa_orf1, aa_orf2, aa_orf3, aa_cds))
+        if len(self.records) >= MUTATION_BUFFER:
+            self.flush()
+
+    def count_tlen(self, tlen, count=1):
+        """Adds pairs to the TLEN histogram."""
+        if tlen >= len(self.tlen_counts):
+            if tlen >= TLEN_LIMIT:
+                self.tlen_long[tlen] = self.tlen_long.get(tlen, 0) + count
+                return
+            self.grow_tlen(tlen + 1)
+        self.tlen_counts[tlen] += count
+
+    def grow_tlen(self, size):
+        """Doubles the TLEN histogram until it has size bins."""
+        length = len(self.tlen_counts)
+        while length < size:
+            length *= 2
+        self.tlen_counts = np.concatenate(
+            (self.tlen_counts,
+             np.zeros(length - len(self.tlen_counts), dtype=np.int64)))
+
+    def count_coverage(self, start, end):
+        """Buffers the bases covered by a read, from start to end - 1."""
+        self.coverage_starts.append(start)
+        self.coverage_ends.append(end)
+        if len(self.coverage_starts) >= COVERAGE_BUFFER:
+            self.flush_coverage()
+
+    def flush_coverage(self):
+        """Adds the buffered reads to the difference array."""
+        if self.coverage_starts:
+            self.add_coverage(np.array(self.coverage_starts, dtype=np.int64),
+                              np.array(self.coverage_ends, dtype=np.int64))
+            self.coverage_starts = []
+            self.coverage_ends = []
+
+    def add_coverage(self, starts, ends):
+        """Adds the bases covered by reads to the difference array."""
+        if len(ends) == 0:
+            return
+        end = int(ends.max())
+        self.grow_coverage(end + 1)
+        self.coverage_end = max(self.coverage_end, end)
+        # Increments of the array type keep np.add.at on its fast path.
+        np.add.at(self.coverage, starts, np.int32(1))
+        np.add.at(self.coverage, ends, np.int32(-1))
+
+    def grow_coverage(self, size):
+        """Doubles the difference array until it has size values."""
+        length = len(self.coverage)
+        while length < size:
+            length *= 2
+        if length > len(self.coverage):
+            self.coverage = np.concatenate(
+                (self.coverage,
+                 np.zeros(length - len(self.coverage), dtype=np.int32)))
+
+    def depth(self):
+        """Returns the depth of each base of the reference.
+
+        The difference array is summed in place, no read can be added to
+        the depth after this.
+        """
+        if not self.coverage_summed:
+            self.flush_coverage()
+            np.cumsum(self.coverage, out=self.coverage)
+            self.coverage_summed = True
+
+        return self.coverage[:self.ref_length or self.coverage_end]
+
+    def count_alleles(self, start, bases, qualities, md):
+        """Buffers the bases of a segment of a read aligned from start."""
+        self.allele_segments.append((start, bases, qualities, md))
+        if len(self.allele_segments) >= ALLELE_BUFFER:
+            self.flush_alleles()
+
+    def flush_alleles(self):
+        """Adds the buffered segments to the allele counts."""
+        if not self.allele_segments:
+            return
+        starts, bases, qualities, md = zip(*self.allele_segments)
+        self.allele_segments = []
+        lengths = np.fromiter(map(len, bases), np.int64, len(bases))
+        codes = np.frombuffer(''.join(bases).encode()
+                              .translate(BASE_TRANSLATION), dtype=np.uint8)
+        # Position of each base, from the start of its segment.
+        positions = np.repeat(np.array(starts, dtype=np.int64)
+                              - np.cumsum(lengths) + lengths, lengths)
+        positions += np.arange(len(codes))
+        if len(positions) > 0:
+            end = int(positions.max()) + 1
+            self.grow_alleles(end)
+            self.allele_end = max(self.allele_end, end)
+        counted = (np.frombuffer(''.join(qualities).encode(), dtype=np.uint8)
+                   >= self.allele_quality + 33)
+        np.add.at(self.allele_counts.reshape(-1),
+                  positions[counted] * len(BASES) + codes[counted],
+                  np.int32(1))
+        # The bases of the reads with MD match the reference, but where MD
+        # gives another base: the read base is then replaced by it.
+        matched = np.repeat(np.array(md, dtype=bool), lengths)
+        reference_counts = self.reference_counts.reshape(-1)
+        np.add.at(reference_counts,
+                  positions[matched] * len(BASES) + codes[matched],
+                  np.int32(1))
+        if self.reference_mismatches:
+            mismatches = np.array(self.reference_mismatches, dtype=np.int64)
+            self.reference_mismatches = []
+            mismatches = mismatches[mismatches[:, 0]
+                                    < len(self.reference_counts)]
+            np.add.at(reference_counts,
+                      mismatches[:, 0] * len(BASES) + mismatches[:, 1],
+                      np.int32(1))
+            found = mismatches[mismatches[:, 2] >= 0]
+            np.add.at(reference_counts,
+                      found[:, 0] * len(BASES) + found[:, 2], np.int32(-1))
+
+    def grow_alleles(self, size):
+        """Doubles the allele counts until they have size rows."""
+        length = len(self.allele_counts)
+        while length < size:
+            length *= 2
+        if length > len(self.allele_counts):
+            rows = length - len(self.allele_counts)
+            self.allele_counts = np.concatenate(
+                (self.allele_counts,
+                 np.zeros((rows, len(BASES)), dtype=np.int32)))
+            self.reference_counts = np.concatenate(
+                (self.reference_counts,
+                 np.zeros((rows, len(BASES)), dtype=np.int32)))
+
+    def alleles(self):
+        """Returns the allele counts and base of each reference position.
+
+        The base is N where no read with MD gives it.
+        """
+        self.flush_alleles()
+        length = self.ref_length or self.allele_end
+        votes = self.reference_counts[:length, :N_CODE]
+        reference_bases = votes.argmax(axis=1).astype(np.uint8)
+        reference_bases[votes.max(axis=1) <= 0] = N_CODE
+
+        return self.allele_counts[:length], reference_bases
+
+    def flush(self):
+        """Appends the buffered mutation records to the CSV file.
+
+        Without CSV file, the records are kept in memory.
+        """
+        if self.csv_name is None:
+            return
+        if self.csv_written:
+            outCsv = open(self.csv_name, 'a')
         else:
-            dico_cigar[info[-1]] = int(info[:-1])
+            outCsv = open(self.csv_name, 'w')
+            outCsv.write(self.csv_title)
+            self.csv_written = True
+        for (qname, position, read_base, md_base, quality, aa_orf1,
+             aa_orf2, aa_orf3, aa_cds) in self.records:
+            # Records with an unknown QUAL value are not written.
+            if quality in QUAL_ACCURACY:
+                outCsv.write(f"{qname}, {position},"
+                             f" {read_base} -> {md_base}, "
+                             f"{QUAL_ACCURACY[quality]}, {aa_orf1},"
+                             f" {aa_orf2}, {aa_orf3}")
+                if aa_cds is not None:
+                    outCsv.write(f", {aa_cds}")
+                outCsv.write("\n")
+        outCsv.close()
+        self.records = []
+
+    def merge(self, other):
+        """Adds the data of the same reference analyzed after this one."""
+        for dico, other_dico in ((self.dico_pair, other.dico_pair),
+                                 (self.dico_cigar, other.dico_cigar),
+                                 (self.dico_align, other.dico_align)):
+            for key, value in other_dico.items():
+                dico[key] = dico.get(key, 0) + value
+        self.grow_tlen(len(other.tlen_counts))
+        self.tlen_counts[:len(other.tlen_counts)] += other.tlen_counts
+        for tlen, count in other.tlen_long.items():
+            self.tlen_long[tlen] = self.tlen_long.get(tlen, 0) + count
+        if self.coverage is not None:
+            self.flush_coverage()
+            other.flush_coverage()
+            other_coverage = other.coverage
+            # A summed depth is added to a depth, a difference array to a
+            # difference array.
+            if other.coverage_summed and not self.coverage_summed:
+                other_coverage = np.diff(other_coverage, prepend=0)
+            elif self.coverage_summed and not other.coverage_summed:
+                other_coverage = np.cumsum(other_coverage, dtype=np.int32)
+            self.grow_coverage(len(other_coverage))
+            self.coverage[:len(other_coverage)] += other_coverage
+            self.coverage_end = max(self.coverage_end, other.coverage_end)
+        if self.allele_counts is not None:
+            self.flush_alleles()
+            other.flush_alleles()
+            self.grow_alleles(len(other.allele_counts))
+            length = len(other.allele_counts)
+            self.allele_counts[:length] += other.allele_counts
+            self.reference_counts[:length] += other.reference_counts
+            self.allele_end = max(self.allele_end, other.allele_end)
+        self.substitution_matrix += other.substitution_matrix
+        if self.quality_matrix is not None:
+            self.quality_matrix += other.quality_matrix
+            self.strand_matrix += other.strand_matrix
+        # Mutation records are appended in the order of the file.
+        if self.csv_name is None:
+            self.records.extend(other.records)
+            return self
+        self.flush()
+        if other.records:
+            other.flush()
+        if other.csv_written:
+            with open(self.csv_name, 'a') as outCsv:
+                with open(other.csv_name) as part:
+                    shutil.copyfileobj(part, outCsv)
+            os.remove(other.csv_name)
+
+        return self
+
+
+def new_reference(input_file, ref, part=None, ref_lengths=None):
+    """Creates the data of a reference of the input file.
+
+    The data of a shard of the file (part) streams its mutation records in
+    a temporary CSV file, without title, merged later in the reference one.
+    The length of the reference is found in ref_lengths, read from the @SQ
+    lines, if given.
+    """
+    csv_name = f'mutationFile_{input_file}_{ref}.csv'
+    slices = '--sub-slices' in ARGUMENTS_LIST
+    width = insert_bin_width()
+    coverage = coverage_options()[0]
+    alleles, quality = variant_options()[:2]
+    ref_length = None
+    if ref_lengths is not None:
+        ref_length = ref_lengths.get(ref)
+    fasta, bed = reference_files()
+    if part is not None:
+        data = ReferenceData(f'{csv_name}.part{part}', slices=slices,
+                             insert_bin=width, ref_length=ref_length,
+                             coverage=coverage, alleles=alleles,
+                             allele_quality=quality)
+    else:
+        csv_title = (f"{ARGUMENTS_LIST[input_file]}\nn°read, Position,"
+                     "Mutation, Base call accuracy (%), ORF1, ORF2, ORF3")
+        if bed is not None:
+            csv_title += ", CDS"
+        data = ReferenceData(csv_name, f"{csv_title}\n", slices, width,
+                             ref_length, coverage, alleles, quality)
+    if fasta is not None:
+        data.genome = open_reference(fasta)
+        if bed is not None:
+            data.cds = cds_annotation(bed).get(ref, [])
 
-    return dico_cigar
+    return data
 
 
-def dynamic_dico(dico_pair, dico_cigar, dico_align, substitutions_list,
-                 dico_substitutions, ref, call_quality_list, mut_position_list,
-                 qname_list, aa_orf1_list, aa_orf2_list, aa_orf3_list):
-    """Stores dict data in correponding dynamic dict."""
-    globals()[f'dico_pair_{ref}'] = dico_pair
-    globals()[f'dico_cigar_{ref}'] = dico_cigar
-    globals()[f'dico_align_{ref}'] = dico_align
-    globals()[f'sub_list_{ref}'] = substitutions_list
-    globals()[f'dico_sub_{ref}'] = dico_substitutions
-    globals()[f'dico_qual_{ref}'] = call_quality_list
-    globals()[f'dico_pos_{ref}'] = mut_position_list
-    globals()[f'dico_qname_{ref}'] = qname_list
-    globals()[f'dico_orf1_{ref}'] = aa_orf1_list
-    globals()[f'dico_orf2_{ref}'] = aa_orf2_list
-    globals()[f'dico_orf3_{ref}'] = aa_orf3_list
-
-    return (globals()[f'dico_pair_{ref}'],
-            globals()[f'dico_cigar_{ref}'], globals()[f'dico_align_{ref}'],
-            globals()[f'sub_list_{ref}'], globals()[f'dico_sub_{ref}'],
-            globals()[f'dico_qual_{ref}'], globals()[f'dico_pos_{ref}'],
-            globals()[f'dico_qname_{ref}'], globals()[f'dico_orf1_{ref}'],
-            globals()[f'dico_orf2_{ref}'], globals()[f'dico_orf3_{ref}'])
-
-
-def sub_analysis(line, read_length, qname_list, mut_position_list,
-                 substitutions_list, call_quality_list,
-                 totally_mapped, aa_orf1_list, aa_orf2_list, aa_orf3_list):
-    """Calls substitutions from 'MD:' field and stores related info."""
-    x = 0
-    for i in range(len(line)):
-        if re.search('^MD:Z:', line[i][:5]) and line[i][5:] != read_length:
-            x = i
-            break
-    if totally_mapped is True and x != 0:
-        mut_position = 0
-        mutations = re.findall(r'[0-9]+\D', line[x][5:])
-        for mut in mutations:
-            qname_list.append(line[0])
-            mut_position += int(mut[:-1])
-            # Tests if the mutation is on the complementary read.
-            if int(line[8]) < 0:
-                mut_position_list.append(int(line[3]) - mut_position)
-            else:
-                mut_position_list.append(int(line[3]) + mut_position)
-            # Stores the mutation in the form 'X -> X'.
-            substitutions_list.append(f'{line[9][mut_position]} -> {mut[-1]}')
-            # Stores the QUAL value of the substituted base.
-            call_quality_list.append(f'{line[10][mut_position]}')
+class Cigar:
+    """Operations of a CIGAR string and the values derived from them.
 
-            aa_orf1_list = compares_orf1(mut_position, line, mut, aa_orf1_list)
-            aa_orf2_list = compares_orf2(mut_position, line, mut, aa_orf2_list)
-            aa_orf3_list = compares_orf3(mut_position, line, mut, aa_orf3_list)
+    totals gives the length of each operation, in the order in which they
+    first appear in the CIGAR.
+    """
 
-            # Adds 1 to count the analyzed mutation.
-            mut_position += 1
+    __slots__ = ('operations', 'totals', 'query_length', 'reference_span',
+                 'totally_mapped')
 
-    return (qname_list, mut_position_list, substitutions_list,
-            aa_orf1_list, aa_orf2_list, aa_orf3_list)
+    def __init__(self, cigar):
+        self.operations = tuple((info[-1], int(info[:-1]))
+                                for info in CIGAR_MATCH.findall(cigar))
+        totals = {}
+        for operation, length in self.operations:
+            totals[operation] = totals.get(operation, 0) + length
+        self.totals = tuple(totals.items())
+        self.query_length = sum(length for operation, length
+                                in self.operations
+                                if operation in CIGAR_QUERY_OPS)
+        self.reference_span = sum(length for operation, length
+                                  in self.operations
+                                  if operation in CIGAR_SPAN_OPS)
+        # A totally mapped read is a single alignment match.
+        self.totally_mapped = TOTAL_MATCH.fullmatch(cigar) is not None
 
 
-def compares_orf1(mut_position, line, mut, aa_orf1_list):
-    """Compares the substituted amino acid on arbitrary ORF1 (as 'XXN')."""
-    # Mutated nucleotide must be at least at position 3.
-    if mut_position - 2 >= 0:
-        # Extract the codon from both sequences.
-        ref_orf1 = (line[9][mut_position - 2], line[9][mut_position - 1],
-                    line[9][mut_position])
-        query_orf1 = (line[9][mut_position - 2], line[9][mut_position - 1],
-                      mut[-1])
-        # Associates the codon to the corresponding amino acid.
-        ref_orf1 = "".join(ref_orf1)
-        query_orf1 = "".join(query_orf1)
-        if ref_orf1 in CODONS:
-            ref_orf1 = CODONS[ref_orf1]
-        else:
-            ref_orf1 = 'ND'
-        if query_orf1 in CODONS:
-            query_orf1 = CODONS[query_orf1]
-        else:
-            query_orf1 = 'ND'
-        if ref_orf1 == query_orf1:
-            if ref_orf1 != 'ND':
-                aa_orf1_list.append('synonymous')
-            else:
-                aa_orf1_list.append('ND')
-        else:
-            aa_orf1_list.append(f'{ref_orf1} to {query_orf1}')
-    # If nucleotide is at position 2 or less, amino acid is "not determined".
-    else:
-        aa_orf1_list.append('ND')
-
-    return(aa_orf1_list)
-
-
-def compares_orf2(mut_position, line, mut, aa_orf2_list):
-    """Compares the substituted amino acid on arbitrary ORF2 (as 'XNX')."""
-    # Mutated nucleotide must be at least at position 2 and not the last one.
-    if mut_position - 1 >= 0 and mut_position + 1 < len(line[9]):
-        ref_orf2 = (line[9][mut_position - 1], line[9][mut_position],
-                    line[9][mut_position + 1])
-        query_orf2 = (line[9][mut_position - 1], mut[-1],
-                      line[9][mut_position + 1])
-        # Associates the codon to the corresponding amino acid.
-        ref_orf2 = "".join(ref_orf2)
-        query_orf2 = "".join(query_orf2)
-        if ref_orf2 in CODONS:
-            ref_orf2 = CODONS[ref_orf2]
-        else:
-            ref_orf2 = 'ND'
-        if query_orf2 in CODONS:
-            query_orf2 = CODONS[query_orf2]
-        else:
-            query_orf2 = 'ND'
-        if ref_orf2 == query_orf2:
-            if ref_orf2 != 'ND':
-                aa_orf2_list.append('synonymous')
-            else:
-                aa_orf2_list.append('ND')
-        else:
-            aa_orf2_list.append(f'{ref_orf2} to {query_orf2}')
-    # If nucleotide is at position 2 or less, amino acid is "not determined".
+@functools.lru_cache(maxsize=CIGAR_CACHE)
+def decode_cigar(cigar):
+    """Returns the Cigar of a CIGAR string, kept for the next reads.
+
+    A few CIGAR strings (e.g. 150M) cover most of the reads.
+    """
+    return Cigar(cigar)
+
+
+# Hits, misses and largest size of the decode_cigar cache of the
+# processes of --workers and --jobs.
+PROCESS_CIGAR_CACHE = [0, 0, 0]
+
+
+def process_cigar_cache():
+    """Returns the hits, misses and size of the decode_cigar cache."""
+    info = decode_cigar.cache_info()
+
+    return info.hits, info.misses, info.currsize
+
+
+def add_cigar_cache(cache):
+    """Adds the process_cigar_cache of another process to the run."""
+    hits, misses, size = cache
+    PROCESS_CIGAR_CACHE[0] += hits
+    PROCESS_CIGAR_CACHE[1] += misses
+    PROCESS_CIGAR_CACHE[2] = max(PROCESS_CIGAR_CACHE[2], size)
+
+
+def cigar_cache_statistics():
+    """Returns the lookups of decode_cigar and the part found in cache."""
+    info = decode_cigar.cache_info()
+    hits = info.hits + PROCESS_CIGAR_CACHE[0]
+    lookups = hits + info.misses + PROCESS_CIGAR_CACHE[1]
+
+    return {'lookups': lookups, 'hits': hits,
+            'hit_rate': round(hits / lookups, 4) if lookups else None,
+            'cached': max(info.currsize, PROCESS_CIGAR_CACHE[2])}
+
+
+def alignment_cigar(line):
+    """Returns the Cigar of an alignment line.
+
+    The CIGAR of a BAM record is read from its decoded operations.
+    """
+    if type(line) == BamRecord:
+        return decode_cigar(bam_cigar(line.cigar))
+
+    return decode_cigar(line[5])
+
+
+def alignment_values(line):
+    """Returns FLAG, POS, TLEN and the Cigar of an alignment line.
+
+    The integers of a BAM record are used as decoded, without their text.
+    """
+    if type(line) == BamRecord:
+        return (line.flag, line.pos + 1, line.tlen,
+                decode_cigar(bam_cigar(line.cigar)))
+
+    return int(line[1]), int(line[3]), int(line[8]), decode_cigar(line[5])
+
+
+def output_cigar_cache():
+    """Prints the part of the CIGAR found decoded in the cache."""
+    cigar_cache = cigar_cache_statistics()
+    if cigar_cache['lookups']:
+        print(f"\nCIGAR cache: {cigar_cache['hits']} of"
+              f" {cigar_cache['lookups']} CIGAR found decoded"
+              f" ({round(cigar_cache['hit_rate'] * 100, 2)}%),"
+              f" {cigar_cache['cached']} kept")
+
+
+def cigar_analysis(cigar, dico_cigar):
+    """Stores cigar info in a dictionary."""
+    for operation, length in cigar.totals:
+        dico_cigar[operation] = dico_cigar.get(operation, 0) + length
+
+    return dico_cigar
+
+
+def coverage_analysis(flag, pos, cigar, data):
+    """Adds the reference bases covered by a read to the depth."""
+    if data.coverage is None or flag & COVERAGE_SKIP:
+        return data
+    start = pos - 1
+    span = cigar.reference_span
+    if start >= 0 and span > 0:
+        data.count_coverage(start, start + span)
+
+    return data
+
+
+def allele_analysis(line, flag, pos, cigar, data):
+    """Adds the bases of a read to the allele counts of their position.
+
+    The reads are skipped as in coverage_analysis. A read without QUAL has
+    all its bases counted.
+    """
+    if data.allele_counts is None or flag & COVERAGE_SKIP:
+        return data
+    start = pos - 1
+    bases = line[9]
+    if start < 0 or bases == '*':
+        return data
+    qualities = line[10]
+    if len(qualities) != len(bases):
+        qualities = '~' * len(bases)
+    md = SamTags(line[MIN_LINE_LENGHT:]).md
+    # Aligned segments of the read: reference start, read start, length.
+    if cigar.totally_mapped:
+        segments = ((start, 0, len(bases)),)
     else:
-        aa_orf2_list.append('ND')
-
-    return(aa_orf2_list)
-
-
-def compares_orf3(mut_position, line, mut, aa_orf3_list):
-    """Compares the substituted amino acid on arbitrary ORF3 (as 'NXX')."""
-    # Mutated nucleotide must not be the last or second last one.
-    if (mut_position + 2) < len(line[9]):
-        ref_orf3 = (line[9][mut_position], line[9][mut_position + 1],
-                    line[9][mut_position + 2])
-        query_orf3 = (mut[-1], line[9][mut_position + 1],
-                      line[9][mut_position + 2])
-        # Associates the codon to the corresponding amino acid.
-        ref_orf3 = "".join(ref_orf3)
-        query_orf3 = "".join(query_orf3)
-        if ref_orf3 in CODONS:
-            ref_orf3 = CODONS[ref_orf3]
-        else:
-            ref_orf3 = 'ND'
-        if query_orf3 in CODONS:
-            query_orf3 = CODONS[query_orf3]
-        else:
-            query_orf3 = 'ND'
-        if ref_orf3 == query_orf3:
-            if ref_orf3 != 'ND':
-                aa_orf3_list.append('synonymous')
-            else:
-                aa_orf3_list.append('ND')
+        segments = []
+        read_offset = 0
+        ref_offset = start
+        for operation, length in cigar.operations:
+            if operation in 'M=X':
+                segments.append((ref_offset, read_offset, length))
+            if operation in CIGAR_QUERY_OPS:
+                read_offset += length
+            if operation in CIGAR_SPAN_OPS:
+                ref_offset += length
+    for ref_start, read_start, length in segments:
+        data.count_alleles(ref_start, bases[read_start:read_start + length],
+                           qualities[read_start:read_start + length],
+                           md is not None)
+    if md is not None and not md.isdigit():
+        for read_offset, ref_offset, md_base in md_mismatches(md):
+            position = start + ref_offset
+            # The read base at the mismatch, counted as a reference base.
+            read_code = -1
+            for ref_start, read_start, length in segments:
+                if ref_start <= position < ref_start + length:
+                    read_code = BASE_CODE.get(
+                        bases[read_start + position - ref_start], N_CODE)
+                    break
+            data.reference_mismatches.append(
+                (position, BASE_CODE.get(md_base.upper(), N_CODE),
+                 read_code))
+
+    return data
+
+
+class SamTags:
+    """Optional TAG:TYPE:VALUE fields of an alignment line.
+
+    The fields are indexed by tag as far as the tag read, so the fields
+    after it are only indexed when another tag is read. The values are
+    converted from their type when read.
+    """
+
+    __slots__ = ('fields', 'index', 'indexed')
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.index = {}
+        self.indexed = 0
+
+    def field(self, tag):
+        """Returns the 'TAG:TYPE:VALUE' text of a tag, None if absent."""
+        index = self.index
+        if tag in index:
+            return index[tag]
+        fields = self.fields
+        while self.indexed < len(fields):
+            field = fields[self.indexed]
+            self.indexed += 1
+            # The first field of a repeated tag is kept.
+            index.setdefault(field[:2], field)
+            if field[:2] == tag:
+                return index[tag]
+
+        return None
+
+    def get(self, tag):
+        """Returns the value of a tag, None if absent or not valid."""
+        field = self.field(tag)
+        if field is None:
+            return None
+        value_type = field[3:4]
+        value = field[5:]
+        try:
+            if value_type == 'i':
+                return int(value)
+            if value_type == 'f':
+                return float(value)
+            if value_type == 'B':
+                subtype, *values = value.split(',')
+                convert = float if subtype == 'f' else int
+                return [convert(number) for number in values]
+        except ValueError:
+            return None
+
+        return value
+
+    @property
+    def md(self):
+        """Mismatching positions of the alignment (MD:Z)."""
+        return self.get('MD')
+
+    @property
+    def nm(self):
+        """Edit distance to the reference (NM:i)."""
+        return self.get('NM')
+
+    @property
+    def alignment_score(self):
+        """Alignment score given by the aligner (AS:i)."""
+        return self.get('AS')
+
+    @property
+    def suboptimal_score(self):
+        """Score of the best other alignment of the read (XS:i)."""
+        return self.get('XS')
+
+    @property
+    def read_group(self):
+        """Read group of the read (RG:Z)."""
+        return self.get('RG')
+
+
+def md_mismatches(md):
+    """Returns the read offset, reference offset and base of each mismatch.
+
+    MD alternates numbers of matching bases with a mismatching reference
+    base or a deletion (^ then the deleted reference bases), which only
+    moves the reference offset.
+    """
+    mismatches = []
+    offset = 0
+    # The reference offset is the read offset plus the deleted bases.
+    deleted = 0
+    # Each token is a number of matching bases, then a mismatch or a
+    # deletion if any.
+    for matched, event in MD_TOKEN.findall(md):
+        offset += int(matched)
+        if not event:
+            continue
+        if event[0] == '^':
+            deleted += len(event) - 1
         else:
-            aa_orf3_list.append(f'{ref_orf3} to {query_orf3}')
-    # If nucleotide is at position 2 or less, amino acid is "not determined".
-    else:
-        aa_orf3_list.append('ND')
+            mismatches.append((offset, offset + deleted, event))
+            offset += 1
 
-    return(aa_orf3_list)
+    return mismatches
 
 
-def alignement_pairs(line, dico_align, read_length):
-    """Returns the size of difference or overlap between the paired reads."""
-    # Analyzes only one of the paired reads.
-    if int(line[8]) > 0:
-        # Determines if there is a difference or overlap.
-        difference = int(line[8]) - (2*int(read_length))
-        if difference == 0:
-            dico_align[0] += 1
-        # If there is a gap.
-        elif difference < 0:
-            gap = difference
-            # Rounds the gap to the nearest lower ten.
-            for i in range(-int(read_length), 0, 10):
-                if i - gap >= 0:
-                    if i in dico_align.keys():
-                        dico_align[i] += 1
-                    else:
-                        dico_align[i] = 1
-                    break
-                # If the gap is 10 nucleotide or less add to a predefined key.
-                elif gap > -10:
-                    dico_align[-1] += 1
-                    break
-        # If there is an overlap.
+def sub_analysis(line, flag, pos, tlen, read_length, data, totally_mapped):
+    """Calls substitutions from 'MD:' field and stores related info."""
+    # The optional fields are only read for the totally mapped reads.
+    if totally_mapped is not True:
+        return data
+    md = SamTags(line[MIN_LINE_LENGHT:]).md
+    # An MD of matching bases only has no mismatch. NM is not used to skip
+    # the read, it also counts the insertions and is not always kept up to
+    # date with MD.
+    if md is None or md == read_length or md.isdigit():
+        return data
+    # bin(16) = 10000, '16' in flag means reverse complemented read.
+    strand = (flag >> 4) & 1
+    # The fields used for each mutation are read once.
+    reverse = tlen < 0
+    qname = line[0]
+    bases = line[9]
+    qualities = line[10]
+    # Bases of the read coded from 0 to 4 (A, C, G, T, N).
+    sequence = bases.encode().translate(BASE_TRANSLATION)
+    for read_offset, ref_offset, md_base in md_mismatches(md):
+        # Tests if the mutation is on the complementary read.
+        if reverse:
+            position = pos - ref_offset
         else:
-            overlap = difference
-            # Rounds the overlap to the nearest lower ten.
-            for i in range(0, int(read_length), 10):
-                if i - overlap >= 0:
-                    if i in dico_align.keys():
-                        dico_align[i] += 1
+            position = pos + ref_offset
+        # Stores the mutation in the form 'X -> X', with the QUAL value
+        # of the substituted base.
+        if data.genome is None:
+            effects = compares_orfs(read_offset, sequence, md_base)
+        else:
+            # Codons are read on the reference with the read base, the
+            # effects go from the read to the reference as the mutation.
+            ref_position = pos - 1 + ref_offset
+            effects = reference_orfs(data.genome, line[2], ref_position,
+                                     bases[read_offset])
+            if data.cds is not None:
+                effects += (cds_effect(data.genome, line[2], data.cds,
+                                       ref_position, bases[read_offset]),)
+        data.add_mutation(qname, position, bases[read_offset], md_base,
+                          qualities[read_offset], strand, *effects)
+
+    return data
+
+
+def codon_effect_table():
+    """Returns the effect of each substitution of each codon position."""
+    effects = []
+    # Codons and substitutions are ordered as their codes in BASES.
+    for codon in itertools.product(BASES, repeat=3):
+        ref_aa = CODONS.get("".join(codon), 'ND')
+        for codon_position in range(3):
+            for query_base in BASES:
+                query_codon = list(codon)
+                query_codon[codon_position] = query_base
+                query_aa = CODONS.get("".join(query_codon), 'ND')
+                if ref_aa == query_aa:
+                    if ref_aa != 'ND':
+                        effects.append('synonymous')
                     else:
-                        dico_align[i] = 1
-                    break
-                # If overlap is 10 nucleotide or less add to a predefined key.
-                elif overlap < 10:
-                    dico_align[1] += 1
-                    break
+                        effects.append('ND')
+                else:
+                    effects.append(sys.intern(f'{ref_aa} to {query_aa}'))
 
-    return dico_align
+    return tuple(effects)
+
+
+# Effect of a substitution, at index ((codon * 3) + position) * 5 + base.
+CODON_EFFECTS = codon_effect_table()
+EFFECT_LABELS = tuple(dict.fromkeys(CODON_EFFECTS))
+
+
+@functools.lru_cache(maxsize=None)
+def effect_codes():
+    """Returns the index in EFFECT_LABELS of each codon effect, as an array."""
+    return np.array([EFFECT_LABELS.index(effect)
+                     for effect in CODON_EFFECTS],
+                    dtype=np.int16).reshape(len(BASES) ** 3, 3, len(BASES))
+
+
+def compares_orfs(mut_position, sequence, query_base):
+    """Compares the substituted amino acid on the three arbitrary ORFs.
+
+    The ORFs place the mutated nucleotide last (ORF1, as 'XXN'), in the
+    middle (ORF2, as 'XNX') or first (ORF3, as 'NXX') in the codon. The
+    sequence is given as base codes, the amino acid is "not determined"
+    (ND) when the codon goes beyond the read.
+    """
+    query_code = BASE_CODE.get(query_base, N_CODE)
+    if mut_position - 2 >= 0:
+        codon = ((sequence[mut_position - 2] * 5 + sequence[mut_position - 1])
+                 * 5 + sequence[mut_position])
+        aa_orf1 = CODON_EFFECTS[(codon * 3 + 2) * 5 + query_code]
+    else:
+        aa_orf1 = 'ND'
+    if mut_position - 1 >= 0 and mut_position + 1 < len(sequence):
+        codon = ((sequence[mut_position - 1] * 5 + sequence[mut_position])
+                 * 5 + sequence[mut_position + 1])
+        aa_orf2 = CODON_EFFECTS[(codon * 3 + 1) * 5 + query_code]
+    else:
+        aa_orf2 = 'ND'
+    if mut_position + 2 < len(sequence):
+        codon = ((sequence[mut_position] * 5 + sequence[mut_position + 1])
+                 * 5 + sequence[mut_position + 2])
+        aa_orf3 = CODON_EFFECTS[codon * 3 * 5 + query_code]
+    else:
+        aa_orf3 = 'ND'
+
+    return aa_orf1, aa_orf2, aa_orf3
+
+
+def codon_effects(codons, codon_positions, query_codes):
+    """Returns the effects of arrays of substitutions in coded codons.
+
+    Codons are coded as ((base1 * 5) + base2) * 5 + base3 and bases as
+    their index in BASES.
+    """
+    codes = effect_codes()[codons, codon_positions, query_codes]
+
+    return np.array(EFFECT_LABELS, dtype=object)[codes]
+
+
+def fasta_index(fasta):
+    """Returns the offsets of each sequence of a FASTA file.
+
+    The index uses the '.fai' format (name, length, offset, bases per
+    line, bytes per line). It is written next to the FASTA file on first
+    use and read back afterwards.
+    """
+    fai = f'{fasta}.fai'
+    index = {}
+    if (os.path.isfile(fai) and
+            os.path.getmtime(fai) >= os.path.getmtime(fasta)):
+        with open(fai) as fi:
+            for row in fi:
+                name, length, offset, line_bases, line_width = \
+                    row.split('\t')[:5]
+                index[name] = (int(length), int(offset), int(line_bases),
+                               int(line_width))
+        return index
+
+    name = None
+    offset = 0
+    with open(fasta, 'rb') as fi:
+        for raw in fi:
+            if raw.startswith(b'>'):
+                name = raw[1:].split()[0].decode()
+                # Length, offset, bases per line, bytes per line, last line.
+                index[name] = [0, offset + len(raw), 0, 0, False]
+            elif name is not None and raw.strip():
+                entry = index[name]
+                bases = len(raw.rstrip(b'\r\n'))
+                if entry[4] or (entry[2] != 0 and bases > entry[2]):
+                    raise SamReaderError(f"FORMAT ERROR for '{fasta}': the"
+                                         f" lines of sequence '{name}' are"
+                                         " not of the same length")
+                if entry[2] == 0:
+                    entry[2] = bases
+                    entry[3] = len(raw)
+                elif bases < entry[2]:
+                    entry[4] = True
+                entry[0] += bases
+            offset += len(raw)
+    index = {name: tuple(entry[:4]) for name, entry in index.items()}
+    try:
+        with open(fai, 'w') as fo:
+            for name, entry in index.items():
+                fo.write(name + ''.join(f'\t{value}' for value in entry)
+                         + '\n')
+    except OSError:
+        print(f"INDEX: {fai} could not be written, the index is kept in"
+              " memory.")
+
+    return index
+
+
+class FastaReference:
+    """Reference sequences read through a memory map of the FASTA file.
+
+    Only the index is kept when pickled (for the --workers processes), the
+    file is mapped again on first access.
+    """
+
+    __slots__ = ('fasta', 'index', 'mapped')
+
+    def __init__(self, fasta):
+        """Indexes the FASTA file."""
+        self.fasta = fasta
+        self.index = fasta_index(fasta)
+        self.mapped = None
+
+    def __getstate__(self):
+        return self.fasta, self.index
+
+    def __setstate__(self, state):
+        self.fasta, self.index = state
+        self.mapped = None
+
+    def base_codes(self, name, start, end):
+        """Returns the base codes of a sequence from start to end (0-based).
+
+        The range is cut to the length of the sequence.
+        """
+        if self.mapped is None:
+            with open(self.fasta, 'rb') as fi:
+                self.mapped = mmap.mmap(fi.fileno(), 0,
+                                        access=mmap.ACCESS_READ)
+        length, offset, line_bases, line_width = self.index[name]
+        start = max(start, 0)
+        end = min(end, length)
+        if start >= end:
+            return b''
+        first = offset + (start // line_bases) * line_width
+        first += start % line_bases
+        last = offset + (end // line_bases) * line_width + end % line_bases
+
+        return self.mapped[first:last].translate(REFERENCE_TRANSLATION,
+                                                 b'\r\n')
+
+
+@functools.lru_cache(maxsize=None)
+def open_reference(fasta):
+    """Returns the indexed FASTA file, opened once per process."""
+    return FastaReference(fasta)
+
+
+@functools.lru_cache(maxsize=None)
+def cds_annotation(bed):
+    """Returns the CDS of each reference sequence given in a BED file.
+
+    Each reference gets a list of (start, end, strand) sorted by start,
+    with 0-based start and end excluded as in the BED format.
+    """
+    cds = {}
+    with open(bed) as fi:
+        for row in fi:
+            fields = row.rstrip('\r\n').split('\t')
+            if len(fields) < 3 or fields[0].startswith(('#', 'track',
+                                                         'browser')):
+                continue
+            strand = '+'
+            if len(fields) >= 6 and fields[5] == '-':
+                strand = '-'
+            cds.setdefault(fields[0], []).append((int(fields[1]),
+                                                  int(fields[2]), strand))
+    for regions in cds.values():
+        regions.sort()
+
+    return cds
+
+
+def read_codon_effect(codon, codon_position, read_code):
+    """Returns the effect of a substitution from the read to the reference.
+
+    The codon is the one of the reference (three base codes), the read
+    has read_code at codon_position: the effect is written from the amino
+    acid of the read to the one of the reference, as the substitution.
+    """
+    read_codon = list(codon)
+    ref_code = read_codon[codon_position]
+    read_codon[codon_position] = read_code
+    code = (read_codon[0] * 5 + read_codon[1]) * 5 + read_codon[2]
+
+    return CODON_EFFECTS[(code * 3 + codon_position) * 5 + ref_code]
+
+
+def reference_orfs(genome, ref, ref_position, read_base):
+    """Compares the substituted amino acid on the three reference ORFs.
+
+    ORF1, ORF2 and ORF3 read codons starting at 0-based reference
+    positions 0, 1 and 2 (mod 3), the same frames for every read.
+    """
+    if ref not in genome.index:
+        return 'ND', 'ND', 'ND'
+    read_code = BASE_CODE.get(read_base, N_CODE)
+    window_start = max(ref_position - 2, 0)
+    window = genome.base_codes(ref, window_start, ref_position + 3)
+    effects = []
+    for frame in range(3):
+        codon_position = (ref_position - frame) % 3
+        i = ref_position - codon_position - window_start
+        # The codon must be entirely within the reference.
+        if i < 0 or i + 3 > len(window):
+            effects.append('ND')
+        else:
+            effects.append(read_codon_effect(window[i:i + 3],
+                                             codon_position, read_code))
+
+    return tuple(effects)
+
+
+def cds_effect(genome, ref, regions, ref_position, read_base):
+    """Compares the substituted amino acid in the annotated CDS.
+
+    Returns 'NA' outside of the CDS, the CDS of a reference are assumed
+    not to overlap.
+    """
+    i = bisect.bisect_right(regions, (ref_position, float('inf'))) - 1
+    if i < 0 or ref not in genome.index:
+        return 'NA'
+    start, end, strand = regions[i]
+    if ref_position >= end:
+        return 'NA'
+    read_code = BASE_CODE.get(read_base, N_CODE)
+    if strand == '+':
+        codon_position = (ref_position - start) % 3
+        codon_start = ref_position - codon_position
+        if codon_start + 3 > end:
+            return 'ND'
+        codon = genome.base_codes(ref, codon_start, codon_start + 3)
+    else:
+        # Codons are read on the complementary strand from the CDS end.
+        codon_position = (end - 1 - ref_position) % 3
+        codon_start = ref_position + codon_position - 2
+        if codon_start < start:
+            return 'ND'
+        codon = bytes(COMPLEMENT_CODE[code] for code in
+                      reversed(genome.base_codes(ref, codon_start,
+                                                 codon_start + 3)))
+        read_code = COMPLEMENT_CODE[read_code]
+    if len(codon) != 3:
+        return 'ND'
+
+    return read_codon_effect(codon, codon_position, read_code)
+
+
+def align_key(difference, length, width):
+    """Returns the dico_align key of a pair, None if it is not counted.
+
+    The difference between TLEN and twice the read length is rounded to
+    the bin of width nucleotides above it, starting from minus the read
+    length for the negative ones and from 0 for the positive ones.
+    """
+    if difference == 0:
+        return 0
+    if difference < 0:
+        if difference <= -length:
+            return -length
+        # Differences smaller than a bin have their own key.
+        if difference > -width:
+            return -1
+        return -length - ((-(difference + length)) // width) * width
+    if length <= 0:
+        return None
+    if difference < width:
+        return 1
+    key = -((-difference) // width) * width
+    # Differences out of the read length range are not counted.
+    if key >= length:
+        return None
+
+    return key
+
+
+def alignement_pairs(tlen, data, read_length):
+    """Counts the difference or overlap between the paired reads.
+
+    Also counts the TLEN of the pair in its histogram.
+    """
+    # Analyzes only one of the paired reads.
+    if tlen > 0:
+        data.count_tlen(tlen)
+        key = align_key(tlen - 2 * int(read_length), int(read_length),
+                        data.insert_bin)
+        if key is not None:
+            dico_align = data.dico_align
+            dico_align[key] = dico_align.get(key, 0) + 1
+
+    return data
+
+
+def batch_columns(block, ref_codes):
+    """Parses a block of alignment lines in NumPy integer columns."""
+    # BAM records are already decoded as integers.
+    if type(block[0]) == BamRecord:
+        flag = np.fromiter((line.flag for line in block), np.int64,
+                           len(block))
+        pos = np.fromiter((line.pos + 1 for line in block), np.int64,
+                          len(block))
+        mapq = np.fromiter((line.mapq for line in block), np.int64,
+                           len(block))
+        tlen = np.fromiter((line.tlen for line in block), np.int64,
+                           len(block))
+        rname = np.array([ref_codes[line[2]] for line in block],
+                         dtype=np.int64)
+        return flag, pos, mapq, tlen, rname
+    flag = np.array([line[1] for line in block]).astype(np.int64)
+    pos = np.array([line[3] for line in block]).astype(np.int64)
+    mapq = np.array([line[4] for line in block]).astype(np.int64)
+    tlen = np.array([line[8] for line in block]).astype(np.int64)
+    rname = np.array([ref_codes[line[2]] for line in block], dtype=np.int64)
+
+    return flag, pos, mapq, tlen, rname
+
+
+def batch_read_length(cigars, totally_mapped):
+    """Returns the read length given by the CIGAR of totally mapped reads."""
+    length = np.full(len(cigars), UNSET_LENGTH, dtype=np.int64)
+    for i in np.flatnonzero(totally_mapped):
+        length[i] = cigars[i].query_length
+
+    return length
+
+
+def last_value(values, is_set, carry):
+    """Returns for each row the last value set at or before this row."""
+    index = np.where(is_set, np.arange(len(values)), -1)
+    index = np.maximum.accumulate(index)
+
+    return np.where(index >= 0, values[np.maximum(index, 0)], carry)
+
+
+def batch_align_keys(tlen, length, width):
+    """Returns the dico_align key of each pair, as align_key."""
+    difference = tlen - 2 * length
+    # Gaps are rounded to the bin above them from minus the read length.
+    gap = np.where(difference <= -length, -length,
+                   np.where(difference > -width, -1,
+                            -length - ((-(difference + length)) // width)
+                            * width))
+    # Overlaps are rounded to the bin above them below the read length.
+    overlap = np.where(difference < width, 1,
+                       -((-difference) // width) * width)
+    keys = np.where(difference < 0, gap, np.where(difference > 0, overlap, 0))
+    # Overlaps out of the read length range are not counted.
+    counted = ((difference <= 0) |
+               ((length > 0) & ((difference < width) | (overlap < length))))
+
+    return keys, counted
+
+
+def batch_analysis(block, ref_data, input_file, part, unmap_count,
+                   badmap_count, totalmap_count, not_paired_count,
+                   map_status_first, map_status_sec, read_length,
+                   ref_lengths=None):
+    """Analyzes a block of alignment lines with NumPy column operations.
+
+    Gives the same counts as paired_reads, alignement_pairs and
+    coverage_analysis applied on each line. Mapping status and read length
+    set to 'PENDING' (start of a shard) leave the reads depending on them
+    in the returned pending lists.
+    """
+    # References are created in the order in which they appear.
+    ref_codes = {}
+    for line in block:
+        if line[2] not in ref_codes:
+            ref_codes[line[2]] = len(ref_codes)
+            if line[2] not in ref_data:
+                ref_data[line[2]] = new_reference(input_file, line[2], part,
+                                                  ref_lengths)
+    refs = list(ref_codes)
+    flag, pos, mapq, tlen, rname = batch_columns(block, ref_codes)
+
+    unmapped = (flag & 4) != 0
+    first = (flag & 64) != 0
+    second = (flag & 128) != 0
+    cigars = [alignment_cigar(line) for line in block]
+    totally_mapped = np.array([cigar.totally_mapped
+                               for cigar in cigars]) & ~unmapped
+    status = np.where(unmapped, 0, np.where(totally_mapped, 2, 1))
+
+    unmap_count += int(np.count_nonzero(unmapped))
+    totalmap_count += int(np.count_nonzero(totally_mapped))
+    badmap_count += len(block) - int(np.count_nonzero(unmapped |
+                                                      totally_mapped))
+    not_paired_count += int(np.count_nonzero(~first & ~second))
+
+    # Mapping status of the last first and second reads at each row.
+    status_first = last_value(status, first,
+                              MAP_STATUS.index(map_status_first))
+    status_sec = last_value(status, ~first, MAP_STATUS.index(map_status_sec))
+    pending_pairs = []
+    pair_codes = (rname * len(MAP_STATUS) + status_first) * len(MAP_STATUS)
+    pair_codes += status_sec
+    codes, counts = np.unique(pair_codes[second], return_counts=True)
+    for code, count in zip(codes.tolist(), counts.tolist()):
+        code, sec = divmod(code, len(MAP_STATUS))
+        ref, first_code = divmod(code, len(MAP_STATUS))
+        if 'PENDING' in (MAP_STATUS[first_code], MAP_STATUS[sec]):
+            continue
+        pair_count(ref_data[refs[ref]].dico_pair, MAP_STATUS[first_code],
+                   MAP_STATUS[sec], count)
+    pending = second & ((status_first == MAP_STATUS.index('PENDING')) |
+                        (status_sec == MAP_STATUS.index('PENDING')))
+    for i in np.flatnonzero(pending):
+        pending_pairs.append((block[i][2], MAP_STATUS[status_first[i]],
+                              MAP_STATUS[status_sec[i]]))
+
+    # Read length of the last totally mapped read at each row.
+    if read_length == 'PENDING':
+        carry = UNSET_LENGTH
+    else:
+        carry = int(read_length)
+    length = last_value(batch_read_length(cigars, totally_mapped),
+                        totally_mapped, carry)
+    aligned = tlen > 0
+    pending = aligned & (length == UNSET_LENGTH)
+    pending_align = [(block[i][2], int(tlen[i]))
+                     for i in np.flatnonzero(pending)]
+    aligned &= ~pending
+    width = ref_data[refs[0]].insert_bin
+    keys, counted = batch_align_keys(tlen, length, width)
+    for ref in range(len(refs)):
+        # The TLEN of the block are counted with a single bincount.
+        ref_tlen = tlen[aligned & (rname == ref)]
+        data = ref_data[refs[ref]]
+        if len(ref_tlen) > 0:
+            short = ref_tlen < TLEN_LIMIT
+            counts = np.bincount(ref_tlen[short])
+            data.grow_tlen(len(counts))
+            data.tlen_counts[:len(counts)] += counts
+            for value in ref_tlen[~short].tolist():
+                data.count_tlen(value)
+    aligned &= counted
+    for ref in range(len(refs)):
+        ref_keys = keys[aligned & (rname == ref)]
+        # New keys are added in the order in which they appear.
+        keys_found, index, counts = np.unique(ref_keys, return_index=True,
+                                              return_counts=True)
+        dico_align = ref_data[refs[ref]].dico_align
+        for k in np.argsort(index, kind='stable'):
+            key = int(keys_found[k])
+            dico_align[key] = dico_align.get(key, 0) + int(counts[k])
+
+    # The reads covering the reference are added by reference at once.
+    if ref_data[refs[0]].coverage is not None:
+        span = np.fromiter((cigar.reference_span for cigar in cigars),
+                           np.int64, len(block))
+        covered = ((flag & COVERAGE_SKIP) == 0) & (pos > 0) & (span > 0)
+        for ref in range(len(refs)):
+            start = pos[covered & (rname == ref)] - 1
+            ref_data[refs[ref]].add_coverage(
+                start, start + span[covered & (rname == ref)])
+
+    # CIGAR and substitutions are analyzed line by line.
+    ref = 'NULL'
+    for line, cigar, line_flag, line_pos, line_tlen, total in zip(
+            block, cigars, flag.tolist(), pos.tolist(), tlen.tolist(),
+            totally_mapped.tolist()):
+        if line[2] != ref:
+            ref = line[2]
+            data = ref_data[ref]
+        cigar_analysis(cigar, data.dico_cigar)
+        allele_analysis(line, line_flag, line_pos, cigar, data)
+        if total:
+            sub_analysis(line, line_flag, line_pos, line_tlen,
+                         str(cigar.query_length), data, True)
+
+    last_total = np.flatnonzero(totally_mapped)
+    if len(last_total) > 0:
+        read_length = str(cigars[last_total[-1]].query_length)
+    if np.any(first):
+        map_status_first = MAP_STATUS[status[np.flatnonzero(first)[-1]]]
+    if np.any(~first):
+        map_status_sec = MAP_STATUS[status[np.flatnonzero(~first)[-1]]]
+
+    return (unmap_count, badmap_count, totalmap_count, not_paired_count,
+            map_status_first, map_status_sec, read_length, pending_pairs,
+            pending_align)
 
 
 def error_input(ERROR_COUNT, line_number):
     """Determines what to do when errors are found, based on user input."""
-    error_search = input(f"Document non analysable: {ERROR_COUNT} erreur(s)"
-                         " d'expressions régulières trouvée(s) à la line"
-                         f" {line_number}, souhaitez-vous rechercher les"
-                         " erreurs dans le reste du fichier ?\ny/n\n")
+    try:
+        error_search = input(f"Document non analysable: {ERROR_COUNT} "
+                             "erreur(s) d'expressions régulières trouvée(s)"
+                             f" à la line {line_number}, souhaitez-vous "
+                             "rechercher les erreurs dans le reste du "
+                             "fichier ?\ny/n\n")
+    # No answer can be given in the processes of --jobs.
+    except EOFError:
+        error_search = 'n'
+        print()
     if error_search == "n":
         exit()
     elif error_search == 'y':
@@ -771,16 +2685,14 @@ def paired_total_count(dico_pair):
     return paired_total
 
 
-def substitution_count(substitutions_list, dico_substitutions):
-    """Counts each possible substitutions found (A->T,  A->C,  A->G,  etc)."""
-    for mutation in substitutions_list:
-        if mutation in dico_substitutions.keys():
-            dico_substitutions[mutation] += 1
-        else:
-            dico_substitutions[mutation] = 1
-    # Sorts the dictionary in descending order.
-    sorted_dico_sub = sorted(dico_substitutions.items(), key=lambda x: x[1],
-                             reverse=True)
+def substitution_count(substitution_matrix):
+    """Sorts each possible substitutions found (A->T,  A->C,  A->G,  etc)."""
+    read_codes, md_codes = np.nonzero(substitution_matrix)
+    counts = substitution_matrix[read_codes, md_codes]
+    # Sorts in descending order, equal counts in the order of the bases.
+    order = np.argsort(-counts, kind='stable')
+    sorted_dico_sub = [(f'{BASES[read_codes[i]]} -> {BASES[md_codes[i]]}',
+                        int(counts[i])) for i in order]
 
     return sorted_dico_sub
 
@@ -818,8 +2730,9 @@ def output_cigar(outputFile, CIGAR_MATRIX, dico_cigar, cigar_total):
     outputFile.write("\n\n-> Global CIGAR mutations observed on aligned"
                      " sequences:\n\n")
     for key in dico_cigar.keys():
-        [n, m] = np.where(CIGAR_MATRIX == key)
-        outputFile.write(f"{CIGAR_MATRIX[n + 1, m]}:"
+        title = [CIGAR_MATRIX[1][m] for m, operation
+                 in enumerate(CIGAR_MATRIX[0]) if operation == key]
+        outputFile.write(f"{title}:"
                          f" {round((dico_cigar[key] * 100 / cigar_total), 4)}%"
                          f" ({dico_cigar[key]} out of {cigar_total}"
                          " nucleotides)\n")
@@ -840,6 +2753,29 @@ def output_sub(outputFile, sorted_dico_sub):
         outputFile.write("-> No substitutions were found.")
 
 
+def output_sub_strand(outputFile, strand_matrix):
+    """Writes substitutions found on the forward and reverse strands."""
+    outputFile.write("\n\n-> Nucleotide substitutions by strand :\n\n"
+                     "Substitution\t\tForward\t\tReverse"
+                     "\n--------------------------------------------\n")
+    for read_code, md_code in zip(*np.nonzero(strand_matrix.sum(axis=0))):
+        outputFile.write(f"{BASES[read_code]} -> {BASES[md_code]}\t\t\t"
+                         f"{strand_matrix[0, read_code, md_code]}\t\t"
+                         f"{strand_matrix[1, read_code, md_code]}\n")
+
+
+def csv_quality_writes(input_file, quality_matrix, ref):
+    """Compile in a csv file the substitutions found at each QUAL value."""
+    with open(f'qualityFile_{input_file}_{ref}.csv', 'w') as outCsv:
+        outCsv.write(f"{ARGUMENTS_LIST[input_file]}\nQuality, Substitution,"
+                     " Iteration\n")
+        for quality, read_code, md_code in zip(*np.nonzero(quality_matrix)):
+            outCsv.write(f"{quality}, {BASES[read_code]} ->"
+                         f" {BASES[md_code]},"
+                         f" {quality_matrix[quality, read_code, md_code]}\n")
+    print(f"\nCSV FILE:  qualityFile_{input_file}_{ref}.csv created.")
+
+
 def rename_file(input_file, ref):
     """Renames the output file if a name is given by the user."""
     if '-o' in ARGUMENTS_LIST:
@@ -848,27 +2784,15 @@ def rename_file(input_file, ref):
                   f'{ARGUMENTS_LIST[outputIndex + input_file]}_{ref}.txt')
         print(f"OUTPUT FILE: {ARGUMENTS_LIST[outputIndex + input_file]}_{ref}"
               ".txt created.")
+        return f'{ARGUMENTS_LIST[outputIndex + input_file]}_{ref}.txt'
     else:
         print(f"OUTPUT FILE: outputFile_{input_file}_{ref}.txt created.")
+        return f'outputFile_{input_file}_{ref}.txt'
 
 
-def csv_sub_writes(input_file, substitutions_list, call_quality_list,
-                   qname_list, mut_position_list, aa_orf1_list, aa_orf2_list,
-                   aa_orf3_list, ref):
-    """Compile in a csv file info about substitutions."""
-    outCsv = open(f'mutationFile_{input_file}_{ref}.csv', 'w')
-    outCsv.write(f"{ARGUMENTS_LIST[input_file]}\nn°read, Position,"
-                 "Mutation, Base call accuracy (%), ORF1, ORF2, ORF3\n")
-    for x in range(len(substitutions_list)):
-        for call in range(len(QUAL_INTERPRET[0, ])):
-            if call_quality_list[x] == QUAL_INTERPRET[0, call]:
-                quality = int(QUAL_INTERPRET[1, call])
-                outCsv.write(f"{qname_list[x]}, {mut_position_list[x]},"
-                             f" {substitutions_list[x]}, "
-                             f"{round((1-(10**(-quality/10)))*100, 2)}"
-                             f", {aa_orf1_list[x]}, {aa_orf2_list[x]},"
-                             f" {aa_orf3_list[x]}\n")
-    outCsv.close()
+def csv_sub_writes(input_file, data, ref):
+    """Writes the last mutation records of the reference in its csv file."""
+    data.flush()
     print(f"\nCSV FILE:  mutationFile_{input_file}_{ref}.csv created.")
 
 
@@ -879,189 +2803,1374 @@ def output_align_reads(dico_align, outputFile):
                          " on both ends of the fragment.\n")
 
 
-def output_gap_reads(dico_align, outputFile):
+def output_gap_reads(dico_align, outputFile, width=INSERT_BIN):
     """Writes the number of paired-reads with a gap between them."""
     if dico_align[1] != 0:
         outputFile.write(f"{dico_align[1]} read pair(s) present a"
-                         " gap of [1,10[ nucleotides between the forward"
-                         " and the reverse read.\n")
+                         f" gap of [1,{width}[ nucleotides between the"
+                         " forward and the reverse read.\n")
     for gap in dico_align.keys():
         if gap > 0 and gap != 1:
             outputFile.write(f"{dico_align[gap]} read pair(s) present"
-                             f" a gap of [{gap},{gap + 10}[ nucleotides"
+                             f" a gap of [{gap},{gap + width}[ nucleotides"
                              " between the forward and the reverse read.\n")
 
 
-def output_overlap_reads(dico_align, outputFile):
+def output_overlap_reads(dico_align, outputFile, width=INSERT_BIN):
     """Writes the number of paired-read with an overlap between them."""
     if dico_align[-1] != 0:
         outputFile.write(f"{dico_align[-1]} read pair(s) present an"
-                         " overlap of [1,10[ nucleotides between the"
+                         f" overlap of [1,{width}[ nucleotides between the"
                          " forward and the reverse read.\n")
     for overlap in dico_align.keys():
         if overlap < 0 and overlap != -1:
             outputFile.write(f"{dico_align[overlap]} read pair(s) present"
-                             f" an overlap of [{-overlap},{-overlap + 10}["
+                             f" an overlap of [{-overlap},{-overlap + width}["
                              " nucleotides between the forward and the reverse"
                              " read.\n")
 
 
-def main():
-    if len(sys.argv) == 1:
-        help_program()
-    help()
-    fileNumber = input_file_number()
-    map_status_first = 'NULL'
-    map_status_sec = 'NULL'
-    for input_file in range(fileNumber):
-        current_file = ARGUMENTS_LIST[input_file]
-        file_size = os.path.getsize(current_file)
-        file = file_handler(input_file)
-        to_check = integrity_line_number()
-        # variables to reset between each file
-        line_number = 0
-        octet_analyzed = 0
-        header_count = 0
-        read_length = 0
-        unmap_count = 0
-        badmap_count = 0
-        totalmap_count = 0
-        paired_total = 0
-        not_paired_count = 0
-        research_query = False
-        ref = 'NULL'
-        error_search = 'NULL'
-        references = []
-        output_head_list = []
-
-        print(f"\nAnalyzing:\n{current_file}\n")
-
-        for line in file:
-            line_number += 1
+def histogram_quantile(values, counts, fraction):
+    """Returns a quantile of the values of a histogram, as np.quantile.
+
+    The values are sorted, each one repeated counts times.
+    """
+    cumulative = np.cumsum(counts)
+    rank = fraction * (int(cumulative[-1]) - 1)
+    lower = values[np.searchsorted(cumulative, math.floor(rank), 'right')]
+    upper = values[np.searchsorted(cumulative, math.ceil(rank), 'right')]
 
+    return float(lower + (upper - lower) * (rank - math.floor(rank)))
+
+
+def tlen_histogram(data):
+    """Returns the TLEN found in the pairs of a reference and their counts."""
+    values = np.flatnonzero(data.tlen_counts)
+    counts = data.tlen_counts[values]
+    if data.tlen_long:
+        long_values = sorted(data.tlen_long)
+        values = np.concatenate((values, long_values))
+        counts = np.concatenate((counts, [data.tlen_long[tlen]
+                                          for tlen in long_values]))
+
+    return values, counts
+
+
+def tlen_statistics(values, counts):
+    """Returns the median, MAD and TLEN_PERCENTILES of a TLEN histogram."""
+    median = histogram_quantile(values, counts, 0.5)
+    # The MAD is the median of the distances to the median.
+    deviations = np.abs(values - median)
+    order = np.argsort(deviations, kind='stable')
+    mad = histogram_quantile(deviations[order], counts[order], 0.5)
+    percentiles = [histogram_quantile(values, counts, percentile / 100)
+                   for percentile in TLEN_PERCENTILES]
+
+    return median, mad, percentiles
+
+
+def output_tlen(outputFile, values, counts):
+    """Writes the distribution of the TLEN of the pairs."""
+    median, mad, percentiles = tlen_statistics(values, counts)
+    outputFile.write(f"\n-> Insert size (TLEN) of {int(counts.sum())} pairs:"
+                     f" median {round(median, 2)}, MAD {round(mad, 2)}, from"
+                     f" {int(values[0])} to {int(values[-1])}\npercentiles: ")
+    outputFile.write(", ".join(f"{percentile}%: {round(value, 2)}"
+                               for percentile, value
+                               in zip(TLEN_PERCENTILES, percentiles)))
+    outputFile.write("\n")
+
+
+def csv_tlen_writes(input_file, values, counts, ref):
+    """Compile in a csv file the number of pairs of each TLEN."""
+    with open(f'insertSizeFile_{input_file}_{ref}.csv', 'w') as outCsv:
+        outCsv.write(f"{ARGUMENTS_LIST[input_file]}\nTLEN, Pairs\n")
+        for tlen, count in zip(values.tolist(), counts.tolist()):
+            outCsv.write(f"{tlen}, {count}\n")
+    print(f"\nCSV FILE:  insertSizeFile_{input_file}_{ref}.csv created.")
+
+
+def coverage_statistics(depth):
+    """Returns the mean and maximal depth, and the breadth of coverage.
+
+    The breadth is the fraction of the bases covered by at least each
+    depth of COVERAGE_BREADTH.
+    """
+    mean = float(depth.sum(dtype=np.int64)) / len(depth)
+    breadth = [np.count_nonzero(depth >= minimum) / len(depth)
+               for minimum in COVERAGE_BREADTH]
+
+    return mean, int(depth.max()), breadth
+
+
+def low_coverage(depth, low):
+    """Returns the start and end (excluded) of the runs of depth < low."""
+    under = np.concatenate(([False], depth < low, [False]))
+    edges = np.flatnonzero(under[1:] != under[:-1])
+
+    return edges[0::2], edges[1::2]
+
+
+def output_coverage(outputFile, depth, starts, ends, low):
+    """Writes the depth summary of the reference."""
+    mean, maximum, breadth = coverage_statistics(depth)
+    outputFile.write(f"\n-> Coverage depth of {len(depth)} bases: mean"
+                     f" {round(mean, 2)}, max {maximum}\nbreadth: ")
+    outputFile.write(", ".join(f"{minimum}x: {round(fraction * 100, 2)}%"
+                               for minimum, fraction
+                               in zip(COVERAGE_BREADTH, breadth)))
+    outputFile.write(f"\n{len(starts)} interval(s) under {low}x"
+                     f" ({int((ends - starts).sum())} bases)\n")
+
+
+def csv_coverage_writes(input_file, starts, ends, ref):
+    """Compile in a csv file the intervals of low coverage depth."""
+    with open(f'coverageFile_{input_file}_{ref}.csv', 'w') as outCsv:
+        outCsv.write(f"{ARGUMENTS_LIST[input_file]}\nStart, End, Length\n")
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            outCsv.write(f"{start + 1}, {end}, {end - start}\n")
+    print(f"\nCSV FILE:  coverageFile_{input_file}_{ref}.csv created.")
+
+
+def depth_track_writes(input_file, depth, ref):
+    """Writes the depth of each base as little-endian 32-bit integers."""
+    depth.astype('<i4', copy=False).tofile(f'depthFile_{input_file}_{ref}'
+                                           '.bin')
+    print(f"\nDEPTH FILE:  depthFile_{input_file}_{ref}.bin created.")
+
+
+def allele_reference(data, ref, length):
+    """Returns the base code of each position of the reference.
+
+    The bases are read in the FASTA file if given, else those found from
+    the MD of the reads are used.
+    """
+    if data.genome is None or ref not in data.genome.index:
+        return data.alleles()[1]
+    reference = np.full(length, N_CODE, dtype=np.uint8)
+    codes = np.frombuffer(data.genome.base_codes(ref, 0, length),
+                          dtype=np.uint8)
+    reference[:len(codes)] = codes
+
+    return reference
+
+
+def variant_calls(counts, reference, frequency, depth):
+    """Returns the candidate variants of an allele count matrix.
+
+    A variant is a base (A, C, G or T) other than the reference one, found
+    in at least frequency of the bases counted at a position of at least
+    depth bases. The positions of unknown reference base (N) are skipped.
+    Returns their positions (0-based), base codes and the depth of their
+    positions, sorted by position.
+    """
+    total = counts.sum(axis=1, dtype=np.int64)
+    covered = (total >= depth) & (reference != N_CODE)
+    positions = []
+    codes = []
+    for code in range(N_CODE):
+        found = np.flatnonzero(covered & (reference != code)
+                               & (counts[:, code] > 0)
+                               & (counts[:, code] >= frequency * total))
+        positions.append(found)
+        codes.append(np.full(len(found), code, dtype=np.int64))
+    positions = np.concatenate(positions)
+    codes = np.concatenate(codes)
+    order = np.lexsort((codes, positions))
+
+    return positions[order], codes[order], total[positions[order]]
+
+
+def output_variants(outputFile, counts, positions, quality, frequency,
+                    depth):
+    """Writes the number of allele counts and of candidate variants."""
+    outputFile.write(f"\n-> Allele counts of {len(counts)} positions:"
+                     f" {int(counts.sum(dtype=np.int64))} bases of QUAL >="
+                     f" {quality}\n{len(positions)} candidate variant(s) of"
+                     f" frequency >= {round(frequency * 100, 2)}% at depth >="
+                     f" {depth}\n")
+
+
+def csv_variant_writes(input_file, counts, reference, positions, codes,
+                       totals, ref):
+    """Compile in a csv file the candidate variants and their counts."""
+    with open(f'variantFile_{input_file}_{ref}.csv', 'w') as outCsv:
+        outCsv.write(f"{ARGUMENTS_LIST[input_file]}\nPosition, Reference,"
+                     " Variant, Depth, Variant count, Frequency (%), A, C, G,"
+                     " T, N\n")
+        for position, code, total in zip(positions.tolist(), codes.tolist(),
+                                         totals.tolist()):
+            row = counts[position].tolist()
+            outCsv.write(f"{position + 1}, {BASES[reference[position]]},"
+                         f" {BASES[code]}, {total}, {row[code]},"
+                         f" {round(row[code] * 100 / total, 2)}, ")
+            outCsv.write(", ".join(str(count) for count in row) + "\n")
+    print(f"\nCSV FILE:  variantFile_{input_file}_{ref}.csv created.")
+
+
+def split_line(raw):
+    """Splits a raw line of a SAM file in its tabulated fields."""
+    return split_fields(raw.decode())
+
+
+def alignment_start(current_file, output_head_list):
+    """Analyzes the header section, returns where the alignments start.
+
+    Also returns the length of the references given in the @SQ lines.
+    """
+    header_count = 0
+    start = 0
+    ref_lengths = {}
+    with open(current_file, 'rb') as fi:
+        for raw in fi:
+            line = split_line(raw)
             (head, header_count,
              output_head_list) = header_analysis(header_count, line,
                                                  output_head_list)
-
             if head == 'no':
-                ERROR_COUNT = integrity_check(line, re, line_number,
-                                              to_check)
-
-            # If there is no errors on the line, ERROR_COUNT equals 0.
-            if head == 'no' and ERROR_COUNT == 0 and research_query is False:
-                if line[2] != ref:
-                    ref = line[2]
-                    if ref not in references:
-                        references.append(ref)
-                        (dico_pair, dico_cigar, dico_align, substitutions_list,
-                         dico_substitutions, call_quality_list,
-                         mut_position_list, qname_list, aa_orf1_list,
-                         aa_orf2_list, aa_orf3_list) = dico_init()
-                    else:
-                        (dico_align, dico_cigar, dico_pair, substitutions_list,
-                         dico_substitutions, call_quality_list,
-                         mut_position_list, qname_list, aa_orf1_list,
-                         aa_orf2_list, aa_orf3_list) = fetch_dico(ref)
-
-                octet_analyzed = analysis_progress(line, file_size,
-                                                   octet_analyzed)
-
-                flag = binary_flag(line[1])
-
-                (unmap_count, badmap_count, totalmap_count, read_length,
-                 not_paired_count, dico_pair, map_status_first,
-                 map_status_sec,
-                 totally_mapped) = paired_reads(flag,
-                                                unmap_count, badmap_count,
-                                                totalmap_count, line,
-                                                dico_pair, not_paired_count,
-                                                map_status_first,
-                                                map_status_sec, read_length)
-
-                dico_cigar = cigar_analysis(line, dico_cigar)
-
-                (qname_list, mut_position_list,
-                 substitutions_list, aa_orf1_list, aa_orf2_list,
-                 aa_orf3_list) = sub_analysis(line, read_length, qname_list,
-                                              mut_position_list,
-                                              substitutions_list,
-                                              call_quality_list,
-                                              totally_mapped,
-                                              aa_orf1_list, aa_orf2_list,
-                                              aa_orf3_list)
-
-                dico_align = alignement_pairs(line, dico_align,
-                                              read_length)
-
-                (globals()[f'dico_pair_{ref}'], globals()[f'dico_cigar_{ref}'],
-                 globals()[f'dico_align_{ref}'], globals()[f'sub_list_{ref}'],
-                 globals()[f'dico_sub_{ref}'],globals()[f'dico_qual_{ref}'],
-                 globals()[f'dico_pos_{ref}'], globals()[f'dico_qname_{ref}'],
-                 globals()[f'dico_orf1_{ref}'], globals()[f'dico_orf2_{ref}'],
-                 globals()[f'dico_orf3_{ref}']) = dynamic_dico(dico_pair,
-                                                    dico_cigar, dico_align,
-                                                    substitutions_list,
-                                                    dico_substitutions, ref,
-                                                    call_quality_list,
-                                                    mut_position_list,
-                                                    qname_list, aa_orf1_list,
-                                                    aa_orf2_list, aa_orf3_list)
-
-            # If there is error on the line, passe once in the condition.
-            if head == 'no' and ERROR_COUNT != 0 and research_query is False:
-                research_query = True
-                error_search, to_check = error_input(ERROR_COUNT,
-                                                     line_number)
-
-        if error_search == "y":
+                break
+            if line[0] == '@SQ':
+                sq_length(line, ref_lengths)
+            start += len(raw)
+
+    return header_count, output_head_list, start, ref_lengths
+
+
+def shard_bounds(current_file, start, workers, first_lines):
+    """Splits the alignment section in byte ranges ending on a new line."""
+    file_size = os.path.getsize(current_file)
+    step = max((file_size - start) // workers, 1)
+    bounds = [start]
+    with open(current_file, 'rb') as fi:
+        # The first shard holds the lines to check for --check <number>.
+        fi.seek(start)
+        for i in range(first_lines):
+            fi.readline()
+        first_end = fi.tell()
+        for k in range(1, workers):
+            # Moves to the first line starting at or after the cut.
+            fi.seek(max(start + k * step, first_end, bounds[-1]) - 1)
+            fi.readline()
+            cut = fi.tell()
+            if cut >= file_size:
+                break
+            if cut > bounds[-1]:
+                bounds.append(cut)
+    bounds.append(file_size)
+
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def shard_analysis(shard):
+    """Analyzes the alignment lines found in one byte range of a SAM file.
+
+    The mapping status of the previous reads and the read length are not
+    known at the start of the shard, the reads depending on them are kept
+    aside until the shards are merged.
+    """
+    (input_file, part, start, end, to_check, header_count, size,
+     ref_lengths) = shard
+    current_file = ARGUMENTS_LIST[input_file]
+    # The CIGAR cache statistics are returned for this shard only.
+    decode_cigar.cache_clear()
+    line_number = 0
+    unmap_count = 0
+    badmap_count = 0
+    totalmap_count = 0
+    not_paired_count = 0
+    map_status_first = 'PENDING'
+    map_status_sec = 'PENDING'
+    read_length = 'PENDING'
+    ref = 'NULL'
+    error = None
+    ref_data = {}
+    pending_pairs = []
+    pending_align = []
+    block = []
+
+    with open(current_file, 'rb') as fi:
+        fi.seek(start)
+        offset = start
+        while offset < end:
+            raw = fi.readline()
+            offset += len(raw)
+            line = split_line(raw)
+            line_number += 1
+
+            ERROR_COUNT = integrity_check(line, re,
+                                          header_count + line_number,
+                                          to_check)
+            # Analysis stops at the first error, as in a serial run.
+            if ERROR_COUNT != 0:
+                error = (line_number, ERROR_COUNT)
+                break
+
+            if size:
+                block.append(line)
+                if len(block) == size:
+                    (unmap_count, badmap_count, totalmap_count,
+                     not_paired_count, map_status_first, map_status_sec,
+                     read_length, block_pairs,
+                     block_align) = batch_analysis(block, ref_data,
+                                                   input_file, part,
+                                                   unmap_count, badmap_count,
+                                                   totalmap_count,
+                                                   not_paired_count,
+                                                   map_status_first,
+                                                   map_status_sec,
+                                                   read_length, ref_lengths)
+                    pending_pairs.extend(block_pairs)
+                    pending_align.extend(block_align)
+                    block = []
+                continue
+
+            if line[2] != ref:
+                ref = line[2]
+                if ref not in ref_data:
+                    ref_data[ref] = new_reference(input_file, ref, part,
+                                                  ref_lengths)
+                data = ref_data[ref]
+
+            flag_value, pos, tlen, cigar = alignment_values(line)
+            flag = binary_flag(flag_value)
+
+            # The mate of a second read may belong to the previous shard.
+            pending = (int(flag[-8]) == 1 and
+                       'PENDING' in (map_status_first, map_status_sec))
+            if pending:
+                pair_dico = defaultdict(int)
+            else:
+                pair_dico = data.dico_pair
+
+            (unmap_count, badmap_count, totalmap_count, read_length,
+             not_paired_count, pair_dico, map_status_first,
+             map_status_sec,
+             totally_mapped) = paired_reads(flag, unmap_count, badmap_count,
+                                            totalmap_count, cigar, pair_dico,
+                                            not_paired_count,
+                                            map_status_first, map_status_sec,
+                                            read_length)
+            if pending:
+                pending_pairs.append((ref, map_status_first, map_status_sec))
+
+            cigar_analysis(cigar, data.dico_cigar)
+            coverage_analysis(flag_value, pos, cigar, data)
+            allele_analysis(line, flag_value, pos, cigar, data)
+            sub_analysis(line, flag_value, pos, tlen, read_length, data,
+                         totally_mapped)
+
+            if read_length == 'PENDING':
+                if tlen > 0:
+                    pending_align.append((ref, tlen))
+            else:
+                alignement_pairs(tlen, data, read_length)
+
+    if block:
+        (unmap_count, badmap_count, totalmap_count, not_paired_count,
+         map_status_first, map_status_sec, read_length, block_pairs,
+         block_align) = batch_analysis(block, ref_data, input_file, part,
+                                       unmap_count, badmap_count,
+                                       totalmap_count, not_paired_count,
+                                       map_status_first, map_status_sec,
+                                       read_length, ref_lengths)
+        pending_pairs.extend(block_pairs)
+        pending_align.extend(block_align)
+    for data in ref_data.values():
+        if data.records:
+            data.flush()
+
+    return {'line_number': line_number, 'unmap_count': unmap_count,
+            'badmap_count': badmap_count, 'totalmap_count': totalmap_count,
+            'not_paired_count': not_paired_count,
+            'map_status_first': map_status_first,
+            'map_status_sec': map_status_sec, 'read_length': read_length,
+            'ref_data': ref_data,
+            'pending_pairs': pending_pairs, 'pending_align': pending_align,
+            'error': error, 'cigar_cache': process_cigar_cache()}
+
+
+def merge_shards(input_file, results, map_status_first, map_status_sec,
+                 ref_lengths=None):
+    """Merges the shards analysis in the order of the file."""
+    read_length = 0
+    unmap_count = 0
+    badmap_count = 0
+    totalmap_count = 0
+    not_paired_count = 0
+    ref_data = {}
+    for result in results:
+        for ref in result['ref_data']:
+            if ref not in ref_data:
+                ref_data[ref] = new_reference(input_file, ref,
+                                              ref_lengths=ref_lengths)
+        # Resolves the reads which depend on the previous shards.
+        for ref, first, sec in result['pending_pairs']:
+            if first == 'PENDING':
+                first = map_status_first
+            if sec == 'PENDING':
+                sec = map_status_sec
+            pair_count(ref_data[ref].dico_pair, first, sec)
+        for ref, tlen in result['pending_align']:
+            alignement_pairs(tlen, ref_data[ref], read_length)
+        for ref, data in result['ref_data'].items():
+            ref_data[ref].merge(data)
+
+        if result['map_status_first'] != 'PENDING':
+            map_status_first = result['map_status_first']
+        if result['map_status_sec'] != 'PENDING':
+            map_status_sec = result['map_status_sec']
+        if result['read_length'] != 'PENDING':
+            read_length = result['read_length']
+        unmap_count += result['unmap_count']
+        badmap_count += result['badmap_count']
+        totalmap_count += result['totalmap_count']
+        not_paired_count += result['not_paired_count']
+
+    return (unmap_count, badmap_count, totalmap_count, not_paired_count,
+            ref_data, map_status_first, map_status_sec)
+
+
+def shard_errors(input_file, results, header_count):
+    """Handles the first integrity error found by the shards, if any."""
+    line_number = header_count
+    for result in results:
+        if result['error'] is not None:
+            line_number += result['error'][0]
+            error_search, to_check = error_input(result['error'][1],
+                                                 line_number)
+            # Checks the rest of the file, as in a serial run.
+            file, position = file_handler(input_file)
+            for n, line in enumerate(file, 1):
+                if n > line_number and line[0] not in HEADERS:
+                    integrity_check(line, re, n, to_check)
             print("End of error research.")
             exit()
+        line_number += result['line_number']
+
+
+def parallel_analysis(input_file, to_check, workers, size, map_status_first,
+                      map_status_sec):
+    """Analyzes a file by splitting its alignments between processes."""
+    current_file = ARGUMENTS_LIST[input_file]
+    print(f"\nAnalyzing:\n{current_file}\n")
+    (header_count, output_head_list, start,
+     ref_lengths) = alignment_start(current_file, [])
+
+    first_lines = 0
+    if type(to_check) == int:
+        first_lines = max(to_check - header_count, 0)
+    shards = []
+    for k, (begin, end) in enumerate(shard_bounds(current_file, start,
+                                                  workers, first_lines)):
+        # With --check <number>, only the first shard has lines to check.
+        if type(to_check) == int and k > 0:
+            shards.append((input_file, k, begin, end, 0, header_count,
+                           size, ref_lengths))
+        else:
+            shards.append((input_file, k, begin, end, to_check,
+                           header_count, size, ref_lengths))
+    with multiprocessing.Pool(workers) as pool:
+        results = pool.map(shard_analysis, shards)
+    for result in results:
+        add_cigar_cache(result['cigar_cache'])
+
+    shard_errors(input_file, results, header_count)
+
+    (unmap_count, badmap_count, totalmap_count, not_paired_count,
+     ref_data, map_status_first,
+     map_status_sec) = merge_shards(input_file, results, map_status_first,
+                                   map_status_sec, ref_lengths)
+
+    if totalmap_count + badmap_count == 0:
+        print("No reads could be analyzed")
+        exit()
 
-        if totalmap_count + badmap_count == 0:
-            print("No reads could be analyzed")
+    line_number = header_count + sum(result['line_number']
+                                     for result in results)
+    written = file_outputs(input_file, ref_data, output_head_list,
+                           header_count, totalmap_count, badmap_count,
+                           unmap_count, line_number, not_paired_count)
+
+    return map_status_first, map_status_sec, written
+
+
+def file_outputs(input_file, ref_data, output_head_list, header_count,
+                 totalmap_count, badmap_count, unmap_count, line_number,
+                 not_paired_count):
+    """Writes the output and CSV files of each reference of a file.
+
+    Returns the names of the files written.
+    """
+    current_file = ARGUMENTS_LIST[input_file]
+    low, track = coverage_options()[1:]
+    quality, frequency, min_depth = variant_options()[1:]
+    written = []
+    for ref, data in ref_data.items():
+        sorted_dico_sub = substitution_count(data.substitution_matrix)
+
+        cigar_total = cigar_total_count(data.dico_cigar)
+        paired_total = paired_total_count(data.dico_pair)
+
+        csv_sub_writes(input_file, data, ref)
+        written.append(data.csv_name)
+        if data.quality_matrix is not None:
+            csv_quality_writes(input_file, data.quality_matrix, ref)
+            written.append(f'qualityFile_{input_file}_{ref}.csv')
+        tlen_values, tlen_pairs = tlen_histogram(data)
+        if len(tlen_values) > 0:
+            csv_tlen_writes(input_file, tlen_values, tlen_pairs, ref)
+            written.append(f'insertSizeFile_{input_file}_{ref}.csv')
+        depth = None
+        # References without length nor covered base (e.g. '*') have no
+        # depth.
+        if data.coverage is not None and len(data.depth()) > 0:
+            depth = data.depth()
+            low_starts, low_ends = low_coverage(depth, low)
+            csv_coverage_writes(input_file, low_starts, low_ends, ref)
+            written.append(f'coverageFile_{input_file}_{ref}.csv')
+            if track:
+                depth_track_writes(input_file, depth, ref)
+                written.append(f'depthFile_{input_file}_{ref}.bin')
+        counts = None
+        if data.allele_counts is not None and len(data.alleles()[0]) > 0:
+            counts = data.alleles()[0]
+            reference = allele_reference(data, ref, len(counts))
+            (variant_positions, variant_codes,
+             variant_depths) = variant_calls(counts, reference, frequency,
+                                             min_depth)
+            csv_variant_writes(input_file, counts, reference,
+                               variant_positions, variant_codes,
+                               variant_depths, ref)
+            written.append(f'variantFile_{input_file}_{ref}.csv')
+
+        with open(f'outputFile_{input_file}_{ref}.txt', 'w') as outputFile:
+            outputFile.write(f"{current_file}\n\nFile informations:\n\n\n")
+            output_header_info(outputFile, output_head_list)
+            output_read_info(outputFile, header_count, totalmap_count,
+                             badmap_count, unmap_count, line_number)
+
+            outputFile.write("\n\n**********************************\n"
+                             f"\nInformations relative to reference: {ref}"
+                             "\n")
+            output_pairs_info(outputFile, data.dico_pair, not_paired_count,
+                              paired_total, ref)
+            if paired_total != 0:
+                outputFile.write("\n\n-> Pairs alignement analysis:\n")
+                output_align_reads(data.dico_align, outputFile)
+                output_gap_reads(data.dico_align, outputFile,
+                                 data.insert_bin)
+                output_overlap_reads(data.dico_align, outputFile,
+                                     data.insert_bin)
+                if len(tlen_values) > 0:
+                    output_tlen(outputFile, tlen_values, tlen_pairs)
+            if depth is not None:
+                output_coverage(outputFile, depth, low_starts, low_ends, low)
+            if counts is not None:
+                output_variants(outputFile, counts, variant_positions,
+                                quality, frequency, min_depth)
+            output_cigar(outputFile, CIGAR_MATRIX, data.dico_cigar,
+                         cigar_total)
+            output_sub(outputFile, sorted_dico_sub)
+            if data.strand_matrix is not None:
+                output_sub_strand(outputFile, data.strand_matrix)
+
+        written.append(rename_file(input_file, ref))
+
+    return written
+
+
+def cache_options():
+    """Returns the directory of the result cache and its size in bytes."""
+    directory = None
+    max_size = CACHE_SIZE
+    if '--cache' in ARGUMENTS_LIST:
+        directory = ARGUMENTS_LIST[ARGUMENTS_LIST.index('--cache') + 1]
+    if '--cache-size' in ARGUMENTS_LIST:
+        i = ARGUMENTS_LIST.index('--cache-size')
+        max_size = int(float(ARGUMENTS_LIST[i+1]) * 1e6)
+        if max_size < 0:
+            print("INPUT ERROR: --cache-size must be positive")
             exit()
 
+    return directory, max_size
+
+
+def file_fingerprint(current_file):
+    """Returns a digest of blocks spread over the file, read quickly."""
+    digest = hashlib.sha1()
+    file_size = os.path.getsize(current_file)
+    with open(current_file, 'rb') as fi:
+        for i in range(FINGERPRINT_BLOCKS):
+            fi.seek(file_size * i // FINGERPRINT_BLOCKS)
+            digest.update(fi.read(FINGERPRINT_BYTES))
+
+    return digest.hexdigest()
+
+
+def result_options():
+    """Returns the options which change the results of the analysis."""
+    options = []
+    arguments = iter(ARGUMENTS_LIST[input_file_number():])
+    for argument in arguments:
+        if argument in CACHE_NEUTRAL:
+            # Skips the value of the option.
+            if CACHE_NEUTRAL[argument]:
+                next(arguments, None)
+        else:
+            options.append(argument)
+    # The results depend on the content of the FASTA and BED files.
+    for path in reference_files():
+        if path is not None and os.path.isfile(path):
+            file_stat = os.stat(path)
+            options.append(f"{path}:{file_stat.st_size}:"
+                           f"{file_stat.st_mtime_ns}")
+
+    return options
+
+
+def cache_key(input_file, map_status_first, map_status_sec):
+    """Returns the key of the results of a file with the given options.
+
+    The mapping status of the previous reads is part of the key, as the
+    first pair of a file depends on it.
+    """
+    current_file = ARGUMENTS_LIST[input_file]
+    file_stat = os.stat(current_file)
+    program = os.stat(__file__)
+    identity = [current_file, input_file, file_stat.st_size,
+                file_stat.st_mtime_ns,
+                file_fingerprint(current_file), result_options(),
+                map_status_first, map_status_sec, program.st_size,
+                program.st_mtime_ns]
+
+    return hashlib.sha256(json.dumps(identity).encode()).hexdigest()
+
+
+def cache_fetch(cache, key, input_file):
+    """Copies the cached outputs of a file, returns the mapping status."""
+    entry = os.path.join(cache, key)
+    try:
+        with open(os.path.join(entry, 'entry.json')) as fi:
+            content = json.load(fi)
+        for name in content['files']:
+            shutil.copyfile(os.path.join(entry, os.path.basename(name)),
+                            name)
+    except (OSError, ValueError):
+        return None
+    # The date of the entry gives the least recently used entries.
+    os.utime(os.path.join(entry, 'entry.json'))
+    print(f"\nResults of '{ARGUMENTS_LIST[input_file]}' taken from the "
+          "cache:")
+    for name in content['files']:
+        print(f"FILE: {name} created.")
+
+    return tuple(content['map_status'])
+
+
+def cache_store(cache, key, input_file, written, map_status_first,
+                map_status_sec, max_size):
+    """Copies the outputs of a file in the cache, then bounds its size."""
+    os.makedirs(cache, exist_ok=True)
+    entry = os.path.join(cache, key)
+    # The entry is complete before it can be found.
+    staging = f"{entry}.{os.getpid()}.tmp"
+    os.makedirs(staging, exist_ok=True)
+    for name in written:
+        shutil.copyfile(name, os.path.join(staging, os.path.basename(name)))
+    with open(os.path.join(staging, 'entry.json'), 'w') as fo:
+        json.dump({'path': ARGUMENTS_LIST[input_file], 'files': written,
+                   'map_status': [map_status_first, map_status_sec],
+                   'size': sum(os.path.getsize(name) for name in written)},
+                  fo)
+    shutil.rmtree(entry, ignore_errors=True)
+    os.replace(staging, entry)
+    cache_evict(cache, max_size)
+
+
+def cache_entries(cache):
+    """Returns the entries of the cache, least recently used first."""
+    entries = []
+    for key in os.listdir(cache):
+        try:
+            with open(os.path.join(cache, key, 'entry.json')) as fi:
+                content = json.load(fi)
+            used = os.path.getmtime(os.path.join(cache, key, 'entry.json'))
+        except (OSError, ValueError):
+            continue
+        entries.append((used, key, content))
+    entries.sort(key=lambda entry: entry[0])
+
+    return entries
+
+
+def cache_evict(cache, max_size):
+    """Removes the least recently used entries above the size of the cache."""
+    entries = cache_entries(cache)
+    total = sum(content['size'] for used, key, content in entries)
+    for used, key, content in entries:
+        if total <= max_size:
+            break
+        shutil.rmtree(os.path.join(cache, key), ignore_errors=True)
+        total -= content['size']
+
+
+def cache_clear(cache, fileNumber):
+    """Removes the entries of the given files, or all the entries."""
+    paths = set(ARGUMENTS_LIST[:fileNumber])
+    removed = 0
+    if os.path.isdir(cache):
+        for used, key, content in cache_entries(cache):
+            if not paths or content['path'] in paths:
+                shutil.rmtree(os.path.join(cache, key), ignore_errors=True)
+                removed += 1
+    print(f"{removed} cached result(s) removed from '{cache}'.")
+
+
+def checkpoint_options():
+    """Returns the lines between two checkpoints, and if --resume is given."""
+    every = 0
+    if '--checkpoint' in ARGUMENTS_LIST:
+        i = ARGUMENTS_LIST.index('--checkpoint')
+        every = int(ARGUMENTS_LIST[i+1])
+        if every < 1:
+            print("INPUT ERROR: --checkpoint must be at least 1")
+            exit()
+
+    return every, '--resume' in ARGUMENTS_LIST
+
+
+def checkpoint_path(input_file):
+    """Returns the path of the checkpoint of a file, next to its outputs."""
+    return f'checkpoint_{input_file}.pkl'
+
+
+def file_digest(current_file, offset):
+    """Returns a digest of the first bytes and the bytes before offset."""
+    digest = hashlib.sha1()
+    with open(current_file, 'rb') as fi:
+        digest.update(fi.read(min(offset, CHECKPOINT_BYTES)))
+        fi.seek(max(offset - CHECKPOINT_BYTES, 0))
+        digest.update(fi.read(min(offset, CHECKPOINT_BYTES)))
+
+    return digest.hexdigest()
+
+
+def checkpoint_options_used():
+    """Returns the options changing the counts kept in a checkpoint."""
+    return (('--sub-slices' in ARGUMENTS_LIST, insert_bin_width(),
+             coverage_options()[0]) + variant_options()[:2]
+            + reference_files())
+
+
+def save_checkpoint(input_file, offset, state):
+    """Writes the state of the analysis after the line ending at offset.
+
+    The mutation records are written first, the size of each CSV file is
+    kept to remove on resume what was written after the checkpoint.
+    """
+    current_file = ARGUMENTS_LIST[input_file]
+    csv_sizes = {}
+    for ref, data in state['ref_data'].items():
+        if data.records:
+            data.flush()
+        if data.csv_written:
+            csv_sizes[ref] = os.path.getsize(data.csv_name)
+    checkpoint = dict(state, path=current_file, offset=offset,
+                      digest=file_digest(current_file, offset),
+                      options=checkpoint_options_used(), csv_sizes=csv_sizes)
+    # The previous checkpoint is only replaced once this one is complete.
+    with open(checkpoint_path(input_file) + '.tmp', 'wb') as fo:
+        pickle.dump(checkpoint, fo)
+    os.replace(checkpoint_path(input_file) + '.tmp',
+               checkpoint_path(input_file))
+
+
+def load_checkpoint(input_file):
+    """Returns the state saved for a file, None if there is none."""
+    current_file = ARGUMENTS_LIST[input_file]
+    if not os.path.isfile(checkpoint_path(input_file)):
+        print(f"No checkpoint found for '{current_file}', the analysis "
+              "starts from the beginning.")
+        return None
+    with open(checkpoint_path(input_file), 'rb') as fi:
+        checkpoint = pickle.load(fi)
+    if (checkpoint['path'] != current_file
+            or checkpoint['options'] != checkpoint_options_used()):
+        print(f"CHECKPOINT ERROR for '{current_file}': the checkpoint was "
+              "made for another file or other options")
+        exit()
+    # The file may only have been appended to since the checkpoint.
+    if (os.path.getsize(current_file) < checkpoint['offset']
+            or file_digest(current_file,
+                           checkpoint['offset']) != checkpoint['digest']):
+        print(f"CHECKPOINT ERROR for '{current_file}': the file changed "
+              "since the checkpoint")
+        exit()
+    for ref, size in checkpoint['csv_sizes'].items():
+        csv_name = checkpoint['ref_data'][ref].csv_name
+        if not os.path.isfile(csv_name) or os.path.getsize(csv_name) < size:
+            print(f"CHECKPOINT ERROR for '{current_file}': '{csv_name}' is "
+                  "missing or shorter than at the checkpoint")
+            exit()
+        with open(csv_name, 'r+b') as outCsv:
+            outCsv.truncate(size)
+    print(f"Resuming '{current_file}' from line {checkpoint['line_number']}"
+          f" (offset {checkpoint['offset']}).")
+
+    return checkpoint
+
+
+def serial_analysis(input_file, to_check, size, region, display, log,
+                    map_status_first, map_status_sec, every=0, resume=False):
+    """Analyzes the lines of a file one after the other, or by blocks.
+
+    With every, the state is saved every this number of lines, and with
+    resume the analysis goes on from the saved state.
+    """
+    current_file = ARGUMENTS_LIST[input_file]
+    # variables to reset between each file
+    line_number = 0
+    header_count = 0
+    read_length = 0
+    unmap_count = 0
+    badmap_count = 0
+    totalmap_count = 0
+    not_paired_count = 0
+    research_query = False
+    ref = 'NULL'
+    error_search = 'NULL'
+    ref_data = {}
+    ref_lengths = {}
+    output_head_list = []
+    block = []
+
+    checkpoints = every or resume
+    if checkpoints and (region is not None
+                        or not current_file.endswith(SAM_EXTENSIONS[0])
+                        or is_stream(current_file)):
+        print("Checkpoints are only made for uncompressed SAM files on"
+              " disk.")
+        checkpoints = False
+    start = 0
+    checkpoint = None
+    if checkpoints and resume:
+        checkpoint = load_checkpoint(input_file)
+    if checkpoint is not None:
+        start = checkpoint['offset']
+        line_number = checkpoint['line_number']
+        header_count = checkpoint['header_count']
+        read_length = checkpoint['read_length']
+        unmap_count = checkpoint['unmap_count']
+        badmap_count = checkpoint['badmap_count']
+        totalmap_count = checkpoint['totalmap_count']
+        not_paired_count = checkpoint['not_paired_count']
+        map_status_first = checkpoint['map_status_first']
+        map_status_sec = checkpoint['map_status_sec']
+        ref_data = checkpoint['ref_data']
+        ref_lengths = checkpoint.get('ref_lengths', {})
+        output_head_list = checkpoint['output_head_list']
+    next_save = line_number + every if checkpoints and every else math.inf
+
+    file, position = file_handler(input_file, region, start)
+    progress = Progress(current_file, position, display, log)
+    next_check = progress.first_check()
+
+    print(f"\nAnalyzing:\n{current_file}\n")
+
+    for line in file:
+        line_number += 1
+
+        (head, header_count,
+         output_head_list) = header_analysis(header_count, line,
+                                             output_head_list)
+        if head != 'no' and line[0] == '@SQ':
+            sq_length(line, ref_lengths)
+            progress.reference_length(line)
+        if line_number == next_check:
+            next_check = progress.sample(line_number, line)
+
+        if head == 'no':
+            ERROR_COUNT = integrity_check(line, re, line_number,
+                                          to_check)
+
+        # If there is no errors on the line, ERROR_COUNT equals 0.
+        if (head == 'no' and ERROR_COUNT == 0 and research_query is False
+                and size):
+            block.append(line)
+            if len(block) == size:
+                (unmap_count, badmap_count, totalmap_count,
+                 not_paired_count, map_status_first, map_status_sec,
+                 read_length, block_pairs,
+                 block_align) = batch_analysis(block, ref_data,
+                                               input_file, None,
+                                               unmap_count, badmap_count,
+                                               totalmap_count,
+                                               not_paired_count,
+                                               map_status_first,
+                                               map_status_sec,
+                                               read_length, ref_lengths)
+                block = []
+
+        elif (head == 'no' and ERROR_COUNT == 0
+              and research_query is False):
+            # The reference data is only looked up when RNAME changes.
+            if line[2] != ref:
+                ref = line[2]
+                if ref not in ref_data:
+                    ref_data[ref] = new_reference(input_file, ref,
+                                                  ref_lengths=ref_lengths)
+                data = ref_data[ref]
+
+            flag_value, pos, tlen, cigar = alignment_values(line)
+            flag = binary_flag(flag_value)
+
+            (unmap_count, badmap_count, totalmap_count, read_length,
+             not_paired_count, data.dico_pair, map_status_first,
+             map_status_sec,
+             totally_mapped) = paired_reads(flag,
+                                            unmap_count, badmap_count,
+                                            totalmap_count, cigar,
+                                            data.dico_pair,
+                                            not_paired_count,
+                                            map_status_first,
+                                            map_status_sec, read_length)
+
+            cigar_analysis(cigar, data.dico_cigar)
+            coverage_analysis(flag_value, pos, cigar, data)
+            allele_analysis(line, flag_value, pos, cigar, data)
+            sub_analysis(line, flag_value, pos, tlen, read_length, data,
+                         totally_mapped)
+            alignement_pairs(tlen, data, read_length)
+
+        # If there is error on the line, passe once in the condition.
+        if head == 'no' and ERROR_COUNT != 0 and research_query is False:
+            research_query = True
+            error_search, to_check = error_input(ERROR_COUNT,
+                                                 line_number)
+
+        # The state is saved between two blocks of --batch.
+        if (line_number >= next_save and not block
+                and research_query is False):
+            next_save = line_number + every
+            save_checkpoint(input_file, position(), {
+                'line_number': line_number, 'header_count': header_count,
+                'read_length': read_length, 'unmap_count': unmap_count,
+                'badmap_count': badmap_count,
+                'totalmap_count': totalmap_count,
+                'not_paired_count': not_paired_count,
+                'map_status_first': map_status_first,
+                'map_status_sec': map_status_sec, 'ref_data': ref_data,
+                'ref_lengths': ref_lengths,
+                'output_head_list': output_head_list})
+
+    if error_search == "y":
+        print("End of error research.")
+        exit()
+
+    if block:
+        (unmap_count, badmap_count, totalmap_count, not_paired_count,
+         map_status_first, map_status_sec, read_length, block_pairs,
+         block_align) = batch_analysis(block, ref_data, input_file,
+                                       None, unmap_count, badmap_count,
+                                       totalmap_count, not_paired_count,
+                                       map_status_first, map_status_sec,
+                                       read_length, ref_lengths)
+
+    if totalmap_count + badmap_count == 0:
+        print("No reads could be analyzed")
+        exit()
+
+    # The last checkpoint lets the lines appended later be analyzed alone.
+    if checkpoints:
+        save_checkpoint(input_file, position(), {
+            'line_number': line_number, 'header_count': header_count,
+            'read_length': read_length, 'unmap_count': unmap_count,
+            'badmap_count': badmap_count, 'totalmap_count': totalmap_count,
+            'not_paired_count': not_paired_count,
+            'map_status_first': map_status_first,
+            'map_status_sec': map_status_sec, 'ref_data': ref_data,
+            'ref_lengths': ref_lengths,
+            'output_head_list': output_head_list})
+
+    if next_check != -1:
+        progress.report(line_number, [], time.monotonic(), done=True)
+    # Clears the progression line, if it was shown.
+    if display:
         sys.stdout.write("\033[F")  # Cursor up one line.
         sys.stdout.write("\033[K")  # Clear the entire line.
 
-        for ref in references:
-            (dico_align, dico_cigar, dico_pair, substitutions_list,
-             dico_substitutions, call_quality_list, mut_position_list,
-             qname_list, aa_orf1_list, aa_orf2_list,
-             aa_orf3_list) = fetch_dico(ref)
-
-            sorted_dico_sub = substitution_count(substitutions_list,
-                                                 dico_substitutions)
-
-            cigar_total = cigar_total_count(dico_cigar)
-            paired_total = paired_total_count(dico_pair)
-
-            csv_sub_writes(input_file, substitutions_list, call_quality_list,
-                           qname_list, mut_position_list, aa_orf1_list,
-                           aa_orf2_list, aa_orf3_list, ref)
-
-            with open(f'outputFile_{input_file}_{ref}.txt', 'w') as outputFile:
-                outputFile.write(f"{current_file}\n\nFile informations:\n\n\n")
-                output_header_info(outputFile, output_head_list)
-                output_read_info(outputFile, header_count, totalmap_count,
-                                 badmap_count, unmap_count, line_number)
-
-                outputFile.write("\n\n**********************************\n"
-                                 f"\nInformations relative to reference: {ref}"
-                                 "\n")
-                output_pairs_info(outputFile, dico_pair, not_paired_count,
-                                  paired_total, ref)
-                if paired_total != 0:
-                    outputFile.write("\n\n-> Pairs alignement analysis:\n")
-                    output_align_reads(dico_align, outputFile)
-                    output_gap_reads(dico_align, outputFile)
-                    output_overlap_reads(dico_align, outputFile)
-                output_cigar(outputFile, CIGAR_MATRIX, dico_cigar,
-                             cigar_total)
-                output_sub(outputFile, sorted_dico_sub)
-
-            rename_file(input_file, ref)
+    written = file_outputs(input_file, ref_data, output_head_list,
+                           header_count, totalmap_count, badmap_count,
+                           unmap_count, line_number, not_paired_count)
+
+    return map_status_first, map_status_sec, written
+
+
+def file_analysis(task):
+    """Analyzes one file in a process of --jobs, from a fresh state.
+
+    Returns the process_cigar_cache of this file, None if the analysis
+    was stopped.
+    """
+    (input_file, to_check, size, region, log, every, resume, cache,
+     max_size) = task
+    decode_cigar.cache_clear()
+    try:
+        key = None
+        if cache is not None and not is_stream(ARGUMENTS_LIST[input_file]):
+            key = cache_key(input_file, 'NULL', 'NULL')
+            if cache_fetch(cache, key, input_file) is not None:
+                return process_cigar_cache()
+        (map_status_first, map_status_sec,
+         written) = serial_analysis(input_file, to_check, size, region, False,
+                                    log, 'NULL', 'NULL', every, resume)
+        if key is not None:
+            cache_store(cache, key, input_file, written, map_status_first,
+                        map_status_sec, max_size)
+    # The analysis of the other files goes on after an error.
+    except SystemExit:
+        return None
+    except SamReaderError as error:
+        print(error)
+        return None
+    except OSError as error:
+        print(f"\nANALYSIS ERROR for '{ARGUMENTS_LIST[input_file]}': "
+              f"{error}")
+        return None
+
+    return process_cigar_cache()
+
+
+def line_fields(line):
+    """Returns the fields of a line given as text, bytes or fields."""
+    if isinstance(line, bytes):
+        return split_line(line)
+    if isinstance(line, str):
+        return split_fields(line)
+
+    return line
+
+
+def source_fields(source):
+    """Returns the lines of a path, a file object or lines, as fields."""
+    if isinstance(source, (str, os.PathLike)):
+        path = os.fspath(source)
+        if (not path.endswith(SAM_EXTENSIONS + (BAM_EXTENSION,))
+                and not is_stream(path)):
+            raise SamReaderError(f"FORMAT ERROR for '{path}': only the SAM"
+                                 " and BAM file formats are accepted as"
+                                 " input")
+        return open_lines(path)[0]
+
+    return map(line_fields, source)
+
+
+class RecordResult:
+    """Result of the analysis of one alignment line.
+
+    Each mutation is a tuple of QNAME, position, read base, reference
+    base (given by MD), QUAL value and effect in the three ORF (and in
+    the CDS), in the order of the 'read -> reference' substitutions. The
+    optional fields are read from tags, a SamTags object.
+    """
+
+    __slots__ = ('line_number', 'name', 'flag', 'reference', 'position',
+                 'status', 'cigar', 'mutations', 'tags')
+
+    def __init__(self, line_number, line, status, cigar, mutations):
+        self.line_number = line_number
+        self.name = line[0]
+        self.flag = int(line[1])
+        self.reference = line[2]
+        self.position = int(line[3])
+        self.status = status
+        self.cigar = cigar
+        self.mutations = mutations
+        self.tags = SamTags(line[MIN_LINE_LENGHT:])
+
+
+class AnalysisResult:
+    """Counts of the alignments of a source, by reference in references.
+
+    The references are ReferenceData objects, their mutation records kept
+    in memory instead of a CSV file.
+    """
+
+    __slots__ = ('source', 'header', 'header_count', 'line_number',
+                 'totalmap_count', 'badmap_count', 'unmap_count',
+                 'not_paired_count', 'map_status_first', 'map_status_sec',
+                 'references', 'ref_lengths')
+
+    def __init__(self, source):
+        self.source = source
+        self.header = []
+        self.header_count = 0
+        self.line_number = 0
+        self.totalmap_count = 0
+        self.badmap_count = 0
+        self.unmap_count = 0
+        self.not_paired_count = 0
+        self.map_status_first = 'NULL'
+        self.map_status_sec = 'NULL'
+        self.references = {}
+        self.ref_lengths = {}
+
+    @property
+    def read_count(self):
+        return self.line_number - self.header_count
+
+
+class SamAnalyzer:
+    """Analyzes SAM or BAM alignments without writing any file.
+
+    The source is a path, a file object or an iterable of lines (text,
+    bytes or lists of fields). The options are those of the command line:
+    check as --check (0, a number of lines, 'ALL', ('sample', rate) or
+    ('stride', k)), sub_slices as --sub-slices, reference and cds as
+    --reference and --cds, insert_bin as --insert-bin, coverage as
+    --coverage (the depth is given by the depth method of each reference),
+    variants and variant_qual as --variants and --variant-qual (the allele
+    counts are given by the alleles method of each reference). Without
+    keep_mutations, the mutation records are only given by record.
+    """
+
+    __slots__ = ('check', 'sub_slices', 'reference', 'cds', 'insert_bin',
+                 'keep_mutations', 'coverage', 'variants', 'variant_qual')
+
+    def __init__(self, check=0, sub_slices=False, reference=None, cds=None,
+                 insert_bin=INSERT_BIN, keep_mutations=True, coverage=False,
+                 variants=False, variant_qual=VARIANT_QUAL):
+        self.check = check
+        self.sub_slices = sub_slices
+        self.reference = reference
+        self.cds = cds
+        self.insert_bin = insert_bin
+        self.keep_mutations = keep_mutations
+        self.coverage = coverage
+        self.variants = variants
+        self.variant_qual = variant_qual
+
+    def new_reference(self, ref, ref_length=None):
+        """Creates the data of a reference, as new_reference."""
+        data = ReferenceData(None, slices=self.sub_slices,
+                             insert_bin=self.insert_bin,
+                             ref_length=ref_length, coverage=self.coverage,
+                             alleles=self.variants,
+                             allele_quality=self.variant_qual)
+        if self.reference is not None:
+            data.genome = open_reference(self.reference)
+            if self.cds is not None:
+                data.cds = cds_annotation(self.cds).get(ref, [])
+
+        return data
+
+    def records(self, source, result=None):
+        """Yields the RecordResult of each alignment of the source.
+
+        The counts of the whole source are added to result, if given.
+        Raises SamReaderError on the first line with invalid fields.
+        """
+        if result is None:
+            result = AnalysisResult(source)
+        references = result.references
+        read_length = 0
+        ref = None
+        for line in source_fields(source):
+            result.line_number += 1
+            (head, result.header_count,
+             result.header) = header_analysis(result.header_count, line,
+                                              result.header)
+            if head != 'no':
+                if line[0] == '@SQ':
+                    sq_length(line, result.ref_lengths)
+                continue
+            if integrity_check(line, re, result.line_number,
+                               self.check) != 0:
+                raise SamReaderError(f"LINE ERROR: invalid field(s) at line"
+                                     f" {result.line_number}")
+            if line[2] != ref:
+                ref = line[2]
+                if ref not in references:
+                    references[ref] = self.new_reference(
+                        ref, result.ref_lengths.get(ref))
+                data = references[ref]
+
+            flag_value, pos, tlen, read_cigar = alignment_values(line)
+            flag = binary_flag(flag_value)
+            (result.unmap_count, result.badmap_count, result.totalmap_count,
+             read_length, result.not_paired_count, data.dico_pair,
+             result.map_status_first, result.map_status_sec,
+             totally_mapped) = paired_reads(flag, result.unmap_count,
+                                            result.badmap_count,
+                                            result.totalmap_count, read_cigar,
+                                            data.dico_pair,
+                                            result.not_paired_count,
+                                            result.map_status_first,
+                                            result.map_status_sec,
+                                            read_length)
+            # The CIGAR operations of the read are added to the reference.
+            cigar = cigar_analysis(read_cigar, {})
+            for operation, count in cigar.items():
+                data.dico_cigar[operation] = (data.dico_cigar.get(operation, 0)
+                                              + count)
+            coverage_analysis(flag_value, pos, read_cigar, data)
+            allele_analysis(line, flag_value, pos, read_cigar, data)
+            first = len(data.records)
+            sub_analysis(line, flag_value, pos, tlen, read_length, data,
+                         totally_mapped)
+            mutations = data.records[first:]
+            if not self.keep_mutations:
+                del data.records[first:]
+            alignement_pairs(tlen, data, read_length)
+
+            if flag[-3] == '1':
+                status = MAP_STATUS[0]
+            elif totally_mapped:
+                status = MAP_STATUS[2]
+            else:
+                status = MAP_STATUS[1]
+            yield RecordResult(result.line_number, line, status, cigar,
+                               mutations)
+
+    def analyze(self, source, callback=None):
+        """Returns the AnalysisResult of a source.
+
+        The callback, if given, is called with the RecordResult of each
+        alignment.
+        """
+        result = AnalysisResult(source)
+        for record in self.records(source, result):
+            if callback is not None:
+                callback(record)
+
+        return result
+
+
+def main():
+    global ARGUMENTS_LIST
+    ARGUMENTS_LIST = sys.argv[1:]
+    if len(sys.argv) == 1:
+        help_program()
+    help()
+    fileNumber = input_file_number()
+    map_status_first = 'NULL'
+    map_status_sec = 'NULL'
+    workers = worker_number()
+    size = batch_size()
+    region = analysis_region()
+    display, log = progress_options()
+    every, resume = checkpoint_options()
+    profile, profile_path = profile_options()
+    cache, max_size = cache_options()
+    profiler = None
+    if profile:
+        profiler = Profiler()
+        profiler.install()
+    if '--index' in ARGUMENTS_LIST:
+        for input_file in range(fileNumber):
+            build_index(input_file)
+        exit()
+    if '--clear-cache' in ARGUMENTS_LIST:
+        if cache is None:
+            print("INPUT ERROR: --clear-cache needs --cache DIR")
+        else:
+            cache_clear(cache, fileNumber)
+        exit()
+    jobs = min(job_number(), fileNumber)
+    # The standard input can not be read by the processes of the pool.
+    if jobs > 1 and '-' in ARGUMENTS_LIST[:fileNumber]:
+        print("With '-', the files are analyzed one after the other.")
+        jobs = 1
+    if jobs > 1:
+        # Each file is analyzed in its own process, with its own state.
+        if profiler is not None:
+            print("INPUT ERROR: --profile can not be used with --jobs")
+            exit()
+        if workers > 1:
+            print("With --jobs, each file is analyzed by a single process.")
+        if region is not None:
+            for input_file in range(fileNumber):
+                current_file = ARGUMENTS_LIST[input_file]
+                if (not current_file.endswith(SAM_EXTENSIONS[0])
+                        or is_stream(current_file)):
+                    print("INPUT ERROR: --region needs uncompressed SAM "
+                          "files")
+                    exit()
+        tasks = [(input_file, integrity_line_number(), size, region, log,
+                  every, resume, cache, max_size)
+                 for input_file in range(fileNumber)]
+        with multiprocessing.Pool(jobs) as pool:
+            analyzed = pool.map(file_analysis, tasks, chunksize=1)
+        for input_file in range(fileNumber):
+            if analyzed[input_file] is None:
+                print(f"\nThe analysis of '{ARGUMENTS_LIST[input_file]}' "
+                      "was stopped.")
+            else:
+                add_cigar_cache(analyzed[input_file])
+        output_cigar_cache()
+        if profiler is not None:
+            profiler.report(profile_path)
+        return
+    for input_file in range(fileNumber):
+        compressed = not ARGUMENTS_LIST[input_file].endswith(SAM_EXTENSIONS[0])
+        # Streams are read once, from the start to the end.
+        streamed = is_stream(ARGUMENTS_LIST[input_file])
+        if region is not None and (compressed or streamed):
+            print("INPUT ERROR: --region needs uncompressed SAM files")
+            exit()
+        key = None
+        if cache is not None and not streamed:
+            key = cache_key(input_file, map_status_first, map_status_sec)
+            cached = cache_fetch(cache, key, input_file)
+            if cached is not None:
+                map_status_first, map_status_sec = cached
+                continue
+        if workers > 1 and (compressed or streamed):
+            print("Compressed, BAM and streamed files are analyzed by a"
+                  " single process.")
+        if (workers > 1 and not compressed and not streamed
+                and region is None):
+            if every or resume:
+                print("Checkpoints are not made with --workers.")
+            (map_status_first, map_status_sec,
+             written) = parallel_analysis(input_file, integrity_line_number(),
+                                          workers, size, map_status_first,
+                                          map_status_sec)
+        else:
+            (map_status_first, map_status_sec,
+             written) = serial_analysis(input_file, integrity_line_number(),
+                                        size, region, display, log,
+                                        map_status_first, map_status_sec,
+                                        every, resume)
+        if key is not None:
+            cache_store(cache, key, input_file, written, map_status_first,
+                        map_status_sec, max_size)
+
+    output_cigar_cache()
+    if profiler is not None:
+        profiler.report(profile_path)
+
+
+# Stages timed by --profile: name, one call timed every N, and whether
+# the first argument is a block of records.
+PROFILED_STAGES = (('header_analysis', PROFILE_SAMPLE, False),
+                   ('integrity_check', PROFILE_SAMPLE, False),
+                   ('binary_flag', PROFILE_SAMPLE, False),
+                   ('paired_reads', PROFILE_SAMPLE, False),
+                   ('cigar_analysis', PROFILE_SAMPLE, False),
+                   ('coverage_analysis', PROFILE_SAMPLE, False),
+                   ('allele_analysis', PROFILE_SAMPLE, False),
+                   ('sub_analysis', PROFILE_SAMPLE, False),
+                   ('alignement_pairs', PROFILE_SAMPLE, False),
+                   ('batch_analysis', 1, True),
+                   ('parallel_analysis', 1, False),
+                   ('file_outputs', 1, False))
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    # Errors of the input files are raised by the functions of the library.
+    except SamReaderError as error:
+        print(error)
+        exit()
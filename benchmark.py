@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# -*- coding utf-8 -*-
+
+"""Measures the throughput of each stage of SamReader on synthetic reads.
+
+Usage:
+======
+    benchmark.py -options
+
+    --reads       number of reads to generate (default 100000)
+    --length      length of the reads (default 100)
+    --single      generates single-end reads instead of pairs
+    --mismatch    substitution rate of the reads (default 0.01)
+    --references  number of references (default 2)
+    --sorted      sorts the reads by coordinate
+    --seed        seed of the generator (default 1)
+    --out         JSON file to save the results in (default benchmark.json)
+    --baseline    JSON file of a previous run to compare the results with
+    --sam         only writes the synthetic SAM file to this path
+"""
+
+import io
+import os
+import re
+import sys
+import json
+import time
+import random
+import tempfile
+import tracemalloc
+import contextlib
+
+import SamReader
+
+
+ARGUMENTS_LIST = sys.argv[1:]
+REF_LENGTH = 10000
+# Fraction of the reads which are unmapped, and soft-clipped.
+UNMAPPED_RATE = 0.02
+CLIPPED_RATE = 0.05
+# Bases soft-clipped at the start of a clipped read.
+CLIPPED_BASES = 5
+MIN_INSERT = 150
+MAX_INSERT = 500
+# A stage slower than the baseline by more than this ratio is reported.
+REGRESSION = 0.9
+STAGES = ('line splitting', 'integrity_check', 'binary_flag + paired_reads',
+          'cigar_analysis', 'sub_analysis', 'alignement_pairs', 'outputs')
+
+
+def option_value(option, default):
+    """Returns the value following an option, converted like the default."""
+    if option in ARGUMENTS_LIST:
+        return type(default)(ARGUMENTS_LIST[ARGUMENTS_LIST.index(option) + 1])
+
+    return default
+
+
+def mutated_read(generator, reference, position, length, mismatch):
+    """Returns the bases of a read and its MD tag value."""
+    bases = list(reference[position:position + length])
+    md = []
+    matched = 0
+    for i in range(length):
+        if generator.random() < mismatch:
+            md.append(f"{matched}{bases[i]}")
+            matched = 0
+            bases[i] = generator.choice([base for base in 'ACGT'
+                                         if base != bases[i]])
+        else:
+            matched += 1
+    md.append(str(matched))
+
+    return ''.join(bases), ''.join(md)
+
+
+def synthetic_record(generator, references, ref, position, length, flag,
+                     mismatch, mate_position, tlen):
+    """Returns the fields of one alignment line."""
+    name = f"r{generator.getrandbits(40):010x}"
+    quality = ''.join(generator.choice('#+5?AFI') for i in range(length))
+    if flag & 4:
+        sequence = ''.join(generator.choice('ACGT') for i in range(length))
+        return [name, str(flag), '*', '0', '0', '*', '*', '0', '0', sequence,
+                quality]
+    clipped = 0
+    if generator.random() < CLIPPED_RATE:
+        clipped = CLIPPED_BASES
+    # POS and MD are those of the aligned bases, after the clipped ones.
+    sequence, md = mutated_read(generator, references[ref], position,
+                                length - clipped, mismatch)
+    cigar = f"{length}M"
+    if clipped:
+        sequence = ''.join(generator.choice('ACGT')
+                           for i in range(clipped)) + sequence
+        cigar = f"{clipped}S{length - clipped}M"
+    mismatches = md.count('A') + md.count('C') + md.count('G') + md.count('T')
+    mate_ref = '=' if mate_position >= 0 else '*'
+
+    return [name, str(flag), ref, str(position + 1), '60', cigar, mate_ref,
+            str(mate_position + 1), str(tlen), sequence, quality,
+            f"NM:i:{mismatches}", f"MD:Z:{md}"]
+
+
+def synthetic_sam(path, reads, length, paired, mismatch, ref_number,
+                  sort, seed):
+    """Writes a reproducible SAM file of random reads on random references."""
+    generator = random.Random(seed)
+    references = {}
+    for i in range(1, ref_number + 1):
+        references[f"ref{i}"] = ''.join(generator.choice('ACGT')
+                                        for j in range(REF_LENGTH))
+    records = []
+    while len(records) < reads:
+        ref = generator.choice(list(references))
+        insert = generator.randint(max(MIN_INSERT, length),
+                                   max(MAX_INSERT, length))
+        start = generator.randrange(REF_LENGTH - insert)
+        unmapped = generator.random() < UNMAPPED_RATE
+        if not paired:
+            flag = generator.choice((0, 16)) | (4 if unmapped else 0)
+            records.append(synthetic_record(generator, references, ref,
+                                            start, length, flag, mismatch,
+                                            -1, 0))
+            continue
+        mate_start = start + insert - length
+        # The second read of a pair is on the reverse strand.
+        first = synthetic_record(generator, references, ref, start, length,
+                                 77 if unmapped else 99, mismatch, mate_start,
+                                 insert)
+        second = synthetic_record(generator, references, ref, mate_start,
+                                  length, 141 if unmapped else 147, mismatch,
+                                  start, -insert)
+        second[0] = first[0]
+        records.extend((first, second))
+    records = records[:reads]
+    if sort:
+        # Unmapped reads are written after the mapped ones.
+        order = {ref: i for i, ref in enumerate(references)}
+        order['*'] = len(order)
+        records.sort(key=lambda record: (order[record[2]], int(record[3])))
+
+    with open(path, 'w') as fo:
+        fo.write(f"@HD\tVN:1.6\tSO:{'coordinate' if sort else 'unsorted'}\n")
+        for ref in references:
+            fo.write(f"@SQ\tSN:{ref}\tLN:{REF_LENGTH}\n")
+        fo.write("@PG\tID:benchmark\tPN:benchmark.py\n")
+        for record in records:
+            fo.write('\t'.join(record) + '\n')
+
+
+def split_stage(state):
+    """Reads the file as lines of fields delimited by tabulations."""
+    with open(state['path']) as fi:
+        state['lines'] = [SamReader.split_fields(line) for line in fi]
+    state['header'] = [line for line in state['lines']
+                       if line[0] in SamReader.HEADERS]
+    state['lines'] = state['lines'][len(state['header']):]
+
+    return len(state['lines'])
+
+
+def integrity_stage(state):
+    """Checks all the fields of each line."""
+    for n, line in enumerate(state['lines'], len(state['header']) + 1):
+        SamReader.integrity_check(line, re, n, 'ALL')
+
+    return len(state['lines'])
+
+
+def paired_stage(state):
+    """Counts the mapping status of the reads and pairs."""
+    unmap_count = 0
+    badmap_count = 0
+    totalmap_count = 0
+    not_paired_count = 0
+    read_length = 0
+    map_status_first = 'NULL'
+    map_status_sec = 'NULL'
+    ref_data = {}
+    analyzed = []
+    for line in state['lines']:
+        if line[2] not in ref_data:
+            ref_data[line[2]] = SamReader.new_reference(0, line[2])
+        data = ref_data[line[2]]
+        flag_value, pos, tlen, cigar = SamReader.alignment_values(line)
+        flag = SamReader.binary_flag(flag_value)
+        (unmap_count, badmap_count, totalmap_count, read_length,
+         not_paired_count, data.dico_pair, map_status_first, map_status_sec,
+         totally_mapped) = SamReader.paired_reads(flag, unmap_count,
+                                                  badmap_count,
+                                                  totalmap_count, cigar,
+                                                  data.dico_pair,
+                                                  not_paired_count,
+                                                  map_status_first,
+                                                  map_status_sec,
+                                                  read_length)
+        analyzed.append((line, flag_value, pos, tlen, cigar, data,
+                         read_length, totally_mapped))
+    state['ref_data'] = ref_data
+    state['analyzed'] = analyzed
+    state['counts'] = (totalmap_count, badmap_count, unmap_count,
+                       not_paired_count)
+
+    return len(analyzed)
+
+
+def cigar_stage(state):
+    """Counts the CIGAR operations of each read."""
+    for (line, flag, pos, tlen, cigar, data, read_length,
+         totally_mapped) in state['analyzed']:
+        SamReader.cigar_analysis(cigar, data.dico_cigar)
+
+    return len(state['analyzed'])
+
+
+def sub_stage(state):
+    """Counts the substitutions and their effect on the ORF."""
+    for (line, flag, pos, tlen, cigar, data, read_length,
+         totally_mapped) in state['analyzed']:
+        SamReader.sub_analysis(line, flag, pos, tlen, read_length, data,
+                               totally_mapped)
+
+    return len(state['analyzed'])
+
+
+def align_stage(state):
+    """Classifies the alignment of the pairs."""
+    for (line, flag, pos, tlen, cigar, data, read_length,
+         totally_mapped) in state['analyzed']:
+        SamReader.alignement_pairs(tlen, data, read_length)
+
+    return len(state['analyzed'])
+
+
+def output_stage(state):
+    """Writes the output and CSV files of each reference."""
+    output_head_list = []
+    header_count = 0
+    for line in state['header']:
+        (head, header_count,
+         output_head_list) = SamReader.header_analysis(header_count, line,
+                                                       output_head_list)
+    totalmap_count, badmap_count, unmap_count, not_paired_count = \
+        state['counts']
+    with contextlib.redirect_stdout(io.StringIO()):
+        SamReader.file_outputs(0, state['ref_data'], output_head_list,
+                               header_count, totalmap_count, badmap_count,
+                               unmap_count,
+                               header_count + len(state['lines']),
+                               not_paired_count)
+
+    return len(state['lines'])
+
+
+STAGE_FUNCTIONS = (split_stage, integrity_stage, paired_stage, cigar_stage,
+                   sub_stage, align_stage, output_stage)
+
+
+def run_stages(path, traced):
+    """Runs the stages in order, returns their time or peak memory."""
+    state = {'path': path}
+    measures = []
+    for stage in STAGE_FUNCTIONS:
+        if traced:
+            tracemalloc.start()
+            stage(state)
+            measures.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        else:
+            start = time.perf_counter()
+            records = stage(state)
+            measures.append((records, time.perf_counter() - start))
+
+    return measures
+
+
+def benchmark(settings):
+    """Generates the reads and measures each stage on them."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'synthetic.sam')
+        synthetic_sam(path, settings['reads'], settings['length'],
+                      settings['paired'], settings['mismatch'],
+                      settings['references'], settings['sorted'],
+                      settings['seed'])
+        # The output files are written in the temporary directory.
+        cwd = os.getcwd()
+        os.chdir(directory)
+        SamReader.ARGUMENTS_LIST = [path]
+        try:
+            timings = run_stages(path, False)
+            # Memory is traced in a second run, tracing slows the stages.
+            peaks = run_stages(path, True)
+        finally:
+            os.chdir(cwd)
+
+    results = {}
+    for name, (records, seconds), peak in zip(STAGES, timings, peaks):
+        results[name] = {'records': records,
+                         'seconds': round(seconds, 4),
+                         'records_per_s': round(records / max(seconds, 1e-9)),
+                         'peak_memory_mb': round(peak / 1e6, 2)}
+
+    return results
+
+
+def compare_baseline(results, baseline):
+    """Prints the results, and the change from the baseline if given."""
+    print(f"{'Stage':<30}{'records/s':>12}{'peak MB':>10}"
+          f"{'baseline':>12}{'ratio':>8}")
+    for name, result in results.items():
+        row = (f"{name:<30}{result['records_per_s']:>12}"
+               f"{result['peak_memory_mb']:>10}")
+        if baseline is not None and name in baseline['stages']:
+            reference = baseline['stages'][name]['records_per_s']
+            ratio = result['records_per_s'] / max(reference, 1)
+            row += f"{reference:>12}{ratio:>8.2f}"
+            if ratio < REGRESSION:
+                row += "  SLOWER"
+        print(row)
+
+
+def main():
+    settings = {'reads': option_value('--reads', 100000),
+                'length': option_value('--length', 100),
+                'paired': '--single' not in ARGUMENTS_LIST,
+                'mismatch': option_value('--mismatch', 0.01),
+                'references': option_value('--references', 2),
+                'sorted': '--sorted' in ARGUMENTS_LIST,
+                'seed': option_value('--seed', 1)}
+    if '--sam' in ARGUMENTS_LIST:
+        synthetic_sam(option_value('--sam', ''), settings['reads'],
+                      settings['length'], settings['paired'],
+                      settings['mismatch'], settings['references'],
+                      settings['sorted'], settings['seed'])
+        exit()
+
+    baseline = None
+    if '--baseline' in ARGUMENTS_LIST:
+        with open(option_value('--baseline', '')) as fi:
+            baseline = json.load(fi)
+        if baseline['settings'] != settings:
+            print("WARNING: the baseline was run with other settings")
+
+    results = benchmark(settings)
+    compare_baseline(results, baseline)
+    with open(option_value('--out', 'benchmark.json'), 'w') as fo:
+        json.dump({'settings': settings, 'python': sys.version.split()[0],
+                   'stages': results}, fo, indent=2)
+
+
+if __name__ == "__main__":
+    main()
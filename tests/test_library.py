@@ -0,0 +1,52 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from SamReader import AnalysisResult, SamAnalyzer  # noqa: E402
+
+
+def test_mutation_read_base_then_reference_base():
+    # The read has a T where MD gives a G on the reference.
+    sequence = 'A' * 78 + 'T' + 'A' * 21
+    line = (f"r1\t0\tref1\t100\t60\t100M\t*\t0\t0\t{sequence}\t{'I' * 100}"
+            "\tNM:i:1\tMD:Z:78G21\n")
+    records = list(SamAnalyzer().records(
+        ["@SQ\tSN:ref1\tLN:1000\n", line]))
+
+    (mutation,) = records[-1].mutations
+    qname, position, read_base, reference_base = mutation[:4]
+    assert (qname, position) == ('r1', 178)
+    assert (read_base, reference_base) == ('T', 'G')
+
+
+def coverage_result(count):
+    analyzer = SamAnalyzer(coverage=True)
+    lines = ["@SQ\tSN:ref1\tLN:300\n"]
+    # Each read has one mismatch, a T where MD gives a G.
+    sequence = 'A' * 50 + 'T' + 'A' * 49
+    lines += [f"r{index}\t0\tref1\t{1 + index}\t60\t100M\t*\t0\t0"
+              f"\t{sequence}\t{'I' * 100}\tNM:i:1\tMD:Z:50G49\n"
+              for index in range(count)]
+    result = AnalysisResult(lines)
+    for _ in analyzer.records(lines, result):
+        pass
+    return result.references['ref1']
+
+
+def test_merge_after_depth():
+    data = coverage_result(20)
+    expected = 2 * data.depth().copy()
+    for first_depth, second_depth in ((True, True), (True, False),
+                                      (False, True)):
+        first, second = coverage_result(20), coverage_result(20)
+        if first_depth:
+            first.depth()
+        if second_depth:
+            second.depth()
+        assert (first.merge(second).depth() == expected).all()
+
+
+def test_merge_keeps_records_without_csv():
+    first, second = coverage_result(20), coverage_result(20)
+    assert len(first.merge(second).records) == 40
@@ -0,0 +1,184 @@
+import os
+import random
+import re
+import struct
+import subprocess
+import sys
+import zlib
+
+SAMREADER = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'SamReader.py')
+
+REFERENCES = ('ref1', 'ref2')
+
+
+def alignment(rng):
+    """Returns the CIGAR, SEQ and tags of a read of 50 bases."""
+    kind = rng.randrange(4)
+    if kind == 0:
+        k = rng.randrange(5, 40)
+        return ('50M', 'A' * k + 'T' + 'A' * (49 - k),
+                f'NM:i:1\tMD:Z:{k}G{49 - k}')
+    if kind == 1:
+        return '5S45M', 'C' * 5 + 'A' * 45, 'NM:i:0\tMD:Z:45'
+    if kind == 2:
+        return '20M2I28M', 'A' * 20 + 'GG' + 'A' * 28, 'NM:i:2\tMD:Z:48'
+    return '25M3D25M', 'A' * 50, 'NM:i:3\tMD:Z:25^CCC25'
+
+
+def synthetic_sam(pairs=40, seed=1):
+    """Returns the lines of a sorted SAM file of paired reads."""
+    rng = random.Random(seed)
+    lines = ["@HD\tVN:1.6\tSO:coordinate\n"]
+    lines += [f"@SQ\tSN:{ref}\tLN:2000\n" for ref in REFERENCES]
+    for ref in REFERENCES:
+        for index in range(pairs):
+            pos = 1 + 40 * index
+            mate = pos + rng.randrange(50, 400)
+            tlen = mate + 50 - pos
+            flags = rng.choice(((99, 147), (83, 163), (97, 145), (65, 129)))
+            for flag, start, mate_start, length in (
+                    (flags[0], pos, mate, tlen),
+                    (flags[1], mate, pos, -tlen)):
+                cigar, sequence, tags = alignment(rng)
+                lines.append(f"{ref}_p{index}\t{flag}\t{ref}\t{start}\t60"
+                             f"\t{cigar}\t=\t{mate_start}\t{length}"
+                             f"\t{sequence}\t{'I' * 50}\t{tags}\n")
+        for flag in (77, 141):
+            lines.append(f"{ref}_u\t{flag}\t*\t0\t0\t*\t*\t0\t0\t{'A' * 50}"
+                         f"\t{'I' * 50}\n")
+
+    return lines
+
+
+def bgzf_block(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush()
+    return (b'\x1f\x8b\x08\x04\0\0\0\0\0\xff\x06\0BC\x02\0'
+            + struct.pack('<H', len(compressed) + 25) + compressed
+            + struct.pack('<II', zlib.crc32(data), len(data)))
+
+
+def sam_to_bam(lines):
+    """Returns the BGZF compressed BAM file of the lines of a SAM file."""
+    header = ''.join(line for line in lines if line[0] == '@').encode()
+    data = bytearray(b'BAM\1' + struct.pack('<i', len(header)) + header
+                     + struct.pack('<i', len(REFERENCES)))
+    for ref in REFERENCES:
+        data += struct.pack('<i', len(ref) + 1) + ref.encode() + b'\0'
+        data += struct.pack('<i', 2000)
+    for line in lines:
+        if line[0] == '@':
+            continue
+        fields = line.rstrip('\n').split('\t')
+        ref_id = REFERENCES.index(fields[2]) if fields[2] in REFERENCES else -1
+        cigar = [int(length) << 4 | 'MIDNSHP=X'.index(operation)
+                 for length, operation in re.findall('([0-9]+)([MIDNSHP=X])',
+                                                     fields[5])]
+        sequence = fields[9]
+        codes = ['=ACMGRSVTWYHKDBN'.index(base) for base in sequence + '=']
+        packed = bytes(codes[i] << 4 | codes[i + 1]
+                       for i in range(0, len(sequence), 2))
+        quality = bytes(ord(char) - 33 for char in fields[10])
+        tags = b''
+        for tag in fields[11:]:
+            name, kind, value = tag.split(':', 2)
+            if kind == 'i':
+                tags += name.encode() + b'i' + struct.pack('<i', int(value))
+            else:
+                tags += name.encode() + b'Z' + value.encode() + b'\0'
+        name = fields[0].encode() + b'\0'
+        record = struct.pack('<iiBBHHHiiii', ref_id, int(fields[3]) - 1,
+                             len(name), int(fields[4]), 0, len(cigar),
+                             int(fields[1]), len(sequence), ref_id,
+                             int(fields[7]) - 1, int(fields[8]))
+        record += (name + struct.pack(f'<{len(cigar)}I', *cigar) + packed
+                   + quality + tags)
+        data += struct.pack('<i', len(record)) + record
+    blocks = [bgzf_block(bytes(data[i:i + 65280]))
+              for i in range(0, len(data), 65280)]
+
+    return b''.join(blocks) + bgzf_block(b'')
+
+
+def run(directory, *arguments):
+    result = subprocess.run([sys.executable, SAMREADER] + list(arguments),
+                            cwd=directory, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    return result
+
+
+def outputs(directory, name='s.sam'):
+    """Returns the content of the output files, with the input name."""
+    files = {}
+    for file_name in os.listdir(directory):
+        if re.match('(outputFile|mutationFile|insertSizeFile)_0_', file_name):
+            with open(os.path.join(directory, file_name)) as fi:
+                files[file_name] = fi.read().replace(name, 's.sam')
+
+    return files
+
+
+def serial_outputs(tmp_path, lines):
+    directory = tmp_path / 'serial'
+    directory.mkdir()
+    with open(directory / 's.sam', 'w') as fo:
+        fo.writelines(lines)
+    run(directory, 's.sam')
+    return outputs(directory)
+
+
+def test_workers_and_batch(tmp_path):
+    # The first cut of --workers 3 falls between the two reads of a pair.
+    lines = synthetic_sam()
+    expected = serial_outputs(tmp_path, lines)
+    for options in (('--workers', '3'), ('--batch', '7'),
+                    ('--workers', '3', '--batch', '7')):
+        directory = tmp_path / '_'.join(options)
+        directory.mkdir()
+        with open(directory / 's.sam', 'w') as fo:
+            fo.writelines(lines)
+        run(directory, 's.sam', *options)
+        assert outputs(directory) == expected, options
+
+
+def test_bam(tmp_path):
+    lines = synthetic_sam()
+    expected = serial_outputs(tmp_path, lines)
+    with open(tmp_path / 's.bam', 'wb') as fo:
+        fo.write(sam_to_bam(lines))
+    for options in ((), ('--batch', '7')):
+        run(tmp_path, 's.bam', *options)
+        assert outputs(tmp_path, 's.bam') == expected, options
+
+
+def test_resume(tmp_path):
+    lines = synthetic_sam()
+    expected = serial_outputs(tmp_path, lines)
+    # The run stops after the first 50 lines, in the middle of a pair. The
+    # records written after its last checkpoint are removed on resume.
+    with open(tmp_path / 's.sam', 'w') as fo:
+        fo.writelines(lines[:50])
+    run(tmp_path, 's.sam', '--checkpoint', '7')
+    for file_name in os.listdir(tmp_path):
+        if file_name.startswith('mutationFile_0_'):
+            with open(tmp_path / file_name, 'a') as fo:
+                fo.write("r0, 1, A -> T, 99.99\n")
+    with open(tmp_path / 's.sam', 'a') as fo:
+        fo.writelines(lines[50:])
+    result = run(tmp_path, 's.sam', '--checkpoint', '7', '--resume')
+    assert "Resuming 's.sam' from line 50" in result.stdout
+    assert outputs(tmp_path) == expected
+
+
+def test_cache(tmp_path):
+    lines = synthetic_sam()
+    expected = serial_outputs(tmp_path, lines)
+    with open(tmp_path / 's.sam', 'w') as fo:
+        fo.writelines(lines)
+    run(tmp_path, 's.sam', '--cache', 'store')
+    for file_name in outputs(tmp_path):
+        os.remove(tmp_path / file_name)
+    result = run(tmp_path, 's.sam', '--cache', 'store')
+    assert "taken from the cache" in result.stdout
+    assert outputs(tmp_path) == expected
@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+
+SAMREADER = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'SamReader.py')
+
+HEADER = "@HD\tVN:1.6\tSO:coordinate\n@SQ\tSN:ref1\tLN:1000\n"
+
+
+def sam_line(name, flag, pos, mate_pos, tlen):
+    return (f"{name}\t{flag}\tref1\t{pos}\t60\t50M\t=\t{mate_pos}\t{tlen}\t"
+            f"{'A' * 50}\t{'I' * 50}\tNM:i:0\tMD:Z:50\n")
+
+
+def run(directory, *arguments):
+    return subprocess.run([sys.executable, SAMREADER] + list(arguments),
+                          cwd=directory, capture_output=True, text=True)
+
+
+def test_region_starting_on_second_mate(tmp_path):
+    # The first mate of r1 ends before the region, its second mate is the
+    # first read of the region.
+    with open(tmp_path / 'sorted.sam', 'w') as fo:
+        fo.write(HEADER)
+        fo.write(sam_line('r1', 99, 100, 600, 550))
+        fo.write(sam_line('r1', 147, 600, 100, -550))
+        fo.write(sam_line('r2', 99, 610, 700, 140))
+        fo.write(sam_line('r2', 147, 700, 610, -140))
+    assert run(tmp_path, 'sorted.sam', '--index').returncode == 0
+
+    for options in ((), ('--batch', '2')):
+        result = run(tmp_path, 'sorted.sam', '--region', 'ref1:500-800',
+                     *options)
+        assert result.returncode == 0, result.stderr
+        with open(tmp_path / 'outputFile_0_ref1.txt') as fi:
+            output = fi.read()
+        # Only the pair read entirely in the region is counted.
+        assert "(1 out of 1 pairs)" in output
+
+
+def test_region_malformed_interval(tmp_path):
+    with open(tmp_path / 'sorted.sam', 'w') as fo:
+        fo.write(HEADER)
+        fo.write(sam_line('r1', 99, 100, 600, 550))
+    for region in ('ref1:100', 'ref1:5-', 'ref1:5-x'):
+        result = run(tmp_path, 'sorted.sam', '--region', region)
+        assert "--region must be given as ref:start-end" in result.stdout
+        assert not (tmp_path / 'outputFile_0_ref1.txt').exists()